@@ -0,0 +1,165 @@
+'''
+actor processes for the deep q agents. each actor plays its own games with a
+copy of the learner's network, published to shared memory every so often, and
+sends the transitions it sees to the learner through a queue, so that playing
+and feature extraction happen on other cores while the learner only samples
+and takes gradient steps.
+
+actors never import tensorflow: they run the network's forward pass with
+numpy_q, and are started with the spawn method, since forking a process that
+has tensorflow loaded isn't safe. a spawned process imports the parent's
+__main__ module again, so that has to keep clear of tensorflow too (main.py
+does: ai_runner only imports the deep q agents once one is picked)
+'''
+import atexit
+import multiprocessing
+import queue
+import random
+
+import numpy as np
+
+from state import TetrisGameState
+from batch_features import feature_matrix
+from numpy_q import NumpyQModel
+import features2
+
+class SharedWeights:
+    '''
+    network weights in shared memory, with a version number that goes up every
+    time new ones are published
+    '''
+
+    def __init__(self, ctx, shapes):
+        self.shapes = [tuple(s) for s in shapes]
+        self.array = ctx.Array('f', sum(int(np.prod(s)) for s in self.shapes))
+        self.version = ctx.Value('i', 0)
+
+    def publish(self, params):
+        with self.array.get_lock():
+            np.frombuffer(self.array.get_obj(), dtype=np.float32)[:] = np.concatenate([p.ravel() for p in params])
+            self.version.value += 1
+
+    def read(self):
+        '''
+        returns (version, params)
+        '''
+        with self.array.get_lock():
+            flat = np.frombuffer(self.array.get_obj(), dtype=np.float32).copy()
+            version = self.version.value
+        params = []
+        for shape in self.shapes:
+            size = int(np.prod(shape))
+            params.append(flat[:size].reshape(shape))
+            flat = flat[size:]
+        return version, params
+
+def _put(transitions, item, stop):
+    # blocks while the learner is behind, but still notices being stopped
+    while not stop.is_set():
+        try:
+            transitions.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            pass
+
+def actor_loop(actor_id, feature_names, weights : SharedWeights, transitions, stop, seed=0,
+        exploration_prob=0.05, batch_size=32):
+    '''
+    play epsilon-greedy games until stop is set, putting lists of
+    (inputs, reward, next_inputs or None) transitions on the transitions queue
+    as ([transitions], games finished since the last put)
+    '''
+    features = [getattr(features2, name) for name in feature_names]
+    rng = random.Random(f'{seed}-{actor_id}')
+    version = model = None
+    games = finished = 0
+    batch = []
+    while not stop.is_set():
+        state = TetrisGameState(seed=f'actor-{seed}-{actor_id}-{games}')
+        moves, X = feature_matrix(state, features)
+        while not stop.is_set():
+            if weights.version.value != version:
+                version, params = weights.read()
+                model = NumpyQModel(params)
+            if rng.random() < exploration_prob:
+                i = rng.randrange(len(moves))
+            else:
+                i = int(np.argmax(model(X)))
+            inputs = X[i].astype(np.float32)
+            gameover, _, _, cleared = state.move_context(*moves[i])
+            if gameover:
+                #penalize game over a little
+                batch.append((inputs, -10, None))
+                games += 1
+                finished += 1
+                break
+            reward = state.board.score(cleared)
+            state.make_move(*moves[i])
+            # the next state's moves are both the end of this transition and the next choice
+            moves, X = feature_matrix(state, features)
+            batch.append((inputs, reward, X))
+            if len(batch) >= batch_size:
+                _put(transitions, (batch, finished), stop)
+                batch = []
+                finished = 0
+        if finished:
+            _put(transitions, (batch, finished), stop)
+            batch = []
+            finished = 0
+
+class ActorPool:
+    '''
+    n_actors actor processes playing with the weights last given to publish()
+    '''
+
+    def __init__(self, n_actors, feature_names, shapes, seed=0, exploration_prob=0.05, max_batches=256):
+        ctx = multiprocessing.get_context('spawn')
+        self.weights = SharedWeights(ctx, shapes)
+        self.transitions = ctx.Queue(maxsize=max_batches)
+        self.stop = ctx.Event()
+        self.processes = [ctx.Process(target=actor_loop, daemon=True,
+                args=(i, feature_names, self.weights, self.transitions, self.stop, seed, exploration_prob))
+            for i in range(n_actors)]
+        self.started = False
+
+    def start(self, params):
+        self.publish(params)
+        for p in self.processes:
+            p.start()
+        self.started = True
+        atexit.register(self.close)
+
+    def publish(self, params):
+        self.weights.publish(params)
+
+    def get(self, timeout=None):
+        '''
+        all the transitions waiting in the queue, waiting for some if there are
+        none. returns ([transitions], games finished)
+        '''
+        batch, finished = self.transitions.get(timeout=timeout)
+        batch = list(batch)
+        while True:
+            try:
+                more, more_finished = self.transitions.get_nowait()
+            except queue.Empty:
+                return batch, finished
+            batch += more
+            finished += more_finished
+
+    def waiting(self):
+        '''
+        whether there are transitions in the queue (a hint, it can be stale)
+        '''
+        return not self.transitions.empty()
+
+    def close(self):
+        if not self.started:
+            return
+        self.stop.set()
+        for p in self.processes:
+            p.join(timeout=1)
+            if p.is_alive():
+                p.terminate()
+        self.started = False
+        atexit.unregister(self.close)
@@ -1,8 +1,9 @@
 from pathlib import Path
+import importlib
+import importlib.util
 import threading
 from time import sleep
 import logging
-from deepq_exp import DeepQExpReplayAgent
 
 from ui import UserInterface
 from state import TetrisGameState
@@ -12,13 +13,48 @@ from board import GameOver
 
 from base_agent import BaseTetrisAgent
 from q474 import TetrisQLearningAgent
-from dellacherie import DellacherieAgent
-from deepq import DeepQAgent
+from dellacherie import DellacherieAgent, DellacherieLookaheadAgent
+from expectimax import ExpectimaxAgent
+from anytime import AnytimeAgent
+from beam import BeamSearchAgent
+from numpy_q import NumpyQAgent
 
 class Options:
     TRAINABLE = 1
     SAVABLE = 2
     MONITOR = 3
+    TIME_BUDGET = 4
+
+class LazyAgent:
+    '''
+    stands in for an agent class in installed_agents, importing it only when
+    it's picked. the deep q agents are behind these so that tensorflow isn't
+    loaded just to show the menu or play the other agents (or in processes
+    spawned from the UI, which import this module again)
+    '''
+
+    def __init__(self, module, cls, agent_name):
+        self.module = module
+        self.cls = cls
+        self.agent_name = agent_name
+
+    def __call__(self, logger) -> BaseTetrisAgent:
+        return getattr(importlib.import_module(self.module), self.cls)(logger)
+
+if importlib.util.find_spec('tensorflow') is not None:
+    deepq_agents = [
+        (LazyAgent('deepq', 'DeepQAgent', 'Deep Q learning agent'),
+            {Options.TRAINABLE, Options.MONITOR, Options.SAVABLE}),
+        (LazyAgent('deepq_exp', 'DeepQExpReplayAgent', 'Deep Q learning with experience replay'),
+            {Options.TRAINABLE, Options.MONITOR, Options.SAVABLE}),
+        (LazyAgent('deepq_exp', 'DeepQPrioritizedReplayAgent', 'Deep Q learning with prioritized experience replay'),
+            {Options.TRAINABLE, Options.MONITOR, Options.SAVABLE}),
+        (LazyAgent('deepq_exp', 'DeepQActorLearnerAgent', 'Deep Q learning with parallel actor processes'),
+            {Options.TRAINABLE, Options.MONITOR, Options.SAVABLE})
+    ]
+else:
+    # no tensorflow: the deep q agents can't train, but their exported models still play with NumpyQAgent
+    deepq_agents = []
 
 class RunState:
     CHOOSE_AGENT = 0
@@ -34,22 +70,28 @@ class AgentMenuItems:
     SAVE = 2
     LOAD = 3
     TRAIN_SILENT = 4
+    TIME_BUDGET = 5
 
 agent_menu_item_name = {
     AgentMenuItems.WATCH : 'watch agent play tetris',
     AgentMenuItems.TRAIN : 'train agent',
     AgentMenuItems.SAVE : 'save agent data',
     AgentMenuItems.LOAD : 'load saved agent data',
-    AgentMenuItems.TRAIN_SILENT : 'train agent without watching'
+    AgentMenuItems.TRAIN_SILENT : 'train agent without watching',
+    AgentMenuItems.TIME_BUDGET : 'set time budget per move'
 }
 
 class AIRunner(Runner):
     
     installed_agents : 'list[tuple[BaseTetrisAgent, set]]' = [
         (TetrisQLearningAgent,  {Options.TRAINABLE}),
-        (DellacherieAgent,      {}),
-        (DeepQAgent,            {Options.TRAINABLE, Options.MONITOR, Options.SAVABLE}),
-        (DeepQExpReplayAgent,   {Options.TRAINABLE, Options.MONITOR, Options.SAVABLE})
+        (DellacherieAgent,      {Options.MONITOR, Options.SAVABLE}),
+        (DellacherieLookaheadAgent, {Options.MONITOR, Options.SAVABLE}),
+        (ExpectimaxAgent,       {Options.MONITOR}),
+        (AnytimeAgent,          {Options.MONITOR, Options.TIME_BUDGET}),
+        (BeamSearchAgent,       {Options.MONITOR}),
+    ] + deepq_agents + [
+        (NumpyQAgent,           {Options.SAVABLE})
     ]
 
     
@@ -78,7 +120,8 @@ class AIRunner(Runner):
         self.menu_item_method = {
             AgentMenuItems.WATCH : self.watch_agent,
             AgentMenuItems.TRAIN : self.train_agent,
-            AgentMenuItems.LOAD  : self.load_weights
+            AgentMenuItems.LOAD  : self.load_weights,
+            AgentMenuItems.TIME_BUDGET : self.set_time_budget
         }
         self.thread = None
 
@@ -96,6 +139,16 @@ class AIRunner(Runner):
             self.show_agent_menu()
 
 
+    def set_time_budget(self):
+        budget = self.ui.get_str(f'time budget per move in ms (now {self.agent.time_budget * 1000:.0f})')
+        try:
+            self.agent.time_budget = float(budget) / 1000
+            self.ui.push_text(f'time budget set to {budget} ms')
+        except ValueError:
+            self.ui.push_text(f'not a number of milliseconds: {budget}')
+        sleep(1)
+        self.show_agent_menu()
+
     def save_weights(self):
         filename = self.ui.get_str('save checkpoint name')
         Path(self.agent.__class__.__name__).mkdir(exist_ok=True)
@@ -245,6 +298,8 @@ class AIRunner(Runner):
                 if Options.SAVABLE in options:
                     # self.agent_menu_items.append(AgentMenuItems.SAVE)
                     self.agent_menu_items.append(AgentMenuItems.LOAD)
+                if Options.TIME_BUDGET in options:
+                    self.agent_menu_items.append(AgentMenuItems.TIME_BUDGET)
                 self.runstate = RunState.AGENT_MENU
                 self.show_agent_menu()
             except (IndexError, ValueError):
@@ -0,0 +1,92 @@
+'''
+expectimax search bounded by time instead of depth: each move is searched
+1 piece deep, then 2 (adding next_tet), then deeper with sampled pieces, until
+time_budget runs out. the move from the deepest search that finished is played
+'''
+from timeit import default_timer as timer
+
+from state import TetrisGameState
+from board import TetrisBoard
+from tetrominoes import Tetromino
+from expectimax import ExpectimaxAgent
+
+class SearchTimeout(Exception):
+    pass
+
+class AnytimeAgent(ExpectimaxAgent):
+
+    agent_name = 'Dellacherie\'s weights, searched as deep as the time budget allows'
+
+    # seconds per move. the 1 piece search always finishes, however long it takes
+    time_budget = 0.05
+    max_depth = 8
+    samples = 2
+
+    def __init__(self, logger):
+        super().__init__(logger)
+        self.deadline = None
+        self.last_depth = 0
+        self.reset_search_stats()
+
+    def reset_search_stats(self):
+        self.moves = 0
+        self.total_depth = 0
+        self.deepest = 0
+        self.search_nodes = 0
+        self.search_time = 0
+
+    def search_stats(self):
+        '''
+        depth reached and search speed over the moves since reset_search_stats()
+        '''
+        return {
+            'moves': self.moves,
+            'mean_depth': self.total_depth / self.moves if self.moves else 0,
+            'max_depth': self.deepest,
+            'nodes': self.search_nodes,
+            'nodes_per_second': self.search_nodes / self.search_time if self.search_time else 0,
+        }
+
+    def check_deadline(self):
+        if self.deadline is not None and timer() > self.deadline:
+            raise SearchTimeout
+
+    def move_values(self, board : TetrisBoard, tet : Tetromino, weights):
+        self.check_deadline()
+        return super().move_values(board, tet, weights)
+
+    def placement_score(self, board : TetrisBoard, tet : Tetromino, orient, col, weights) -> float:
+        # the last ply is scored here rather than through move_values, and is
+        # where most of a search's time goes
+        self.check_deadline()
+        return super().placement_score(board, tet, orient, col, weights)
+
+    def get_best_move(self, state: TetrisGameState) -> 'tuple[int, int]':
+        start = timer()
+        nodes = self.nodes
+        best, _ = self.expectimax_scores(state, 1)
+        depth = 1
+        self.deadline = start + self.time_budget
+        try:
+            while depth < self.max_depth:
+                best, _ = self.expectimax_scores(state, depth + 1)
+                depth += 1
+        except SearchTimeout:
+            pass
+        finally:
+            self.deadline = None
+
+        self.last_depth = depth
+        self.moves += 1
+        self.total_depth += depth
+        self.deepest = max(self.deepest, depth)
+        self.search_nodes += self.nodes - nodes
+        self.search_time += timer() - start
+        return best
+
+    def monitor(self):
+        stats = self.search_stats()
+        out = f'time budget = {self.time_budget * 1000:.0f} ms\n'
+        out += f'depth = {self.last_depth} (mean {stats["mean_depth"]:.2f}, max {stats["max_depth"]})\n'
+        out += f'nodes/s = {stats["nodes_per_second"]:.0f}\n'
+        return out + self.transposition_table.monitor()
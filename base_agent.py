@@ -5,6 +5,11 @@ class BaseTetrisAgent:
 
     agent_name = 'base class for Tetris agents'
 
+    # training games n = 0, 1, 2... get their pieces from seed f'{train_seed}-{n}',
+    # so a training run can be repeated. None leaves them to the global random module
+    train_seed = None
+    train_games = 0
+
     def get_best_move(self, state : TetrisGameState) -> 'tuple[int, int]':
         '''
         given a TetrisGameState, return selected move as (orient, col)
@@ -12,3 +17,11 @@ class BaseTetrisAgent:
 
     def train(self, iters : int):
         pass
+
+    def training_state(self) -> TetrisGameState:
+        '''
+        a new game to train on
+        '''
+        seed = None if self.train_seed is None else f'{self.train_seed}-{self.train_games}'
+        self.train_games += 1
+        return TetrisGameState(seed=seed)
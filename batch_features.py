@@ -0,0 +1,99 @@
+'''
+features for every move of the current tetromino at once. the afterstates are
+stacked into an (N, HEIGHT, WIDTH) boolean array and the board features are
+computed with array operations over all of them instead of a python loop per move
+'''
+import numpy as np
+
+from state import TetrisGameState, legal_moves
+from tetrominoes import tetlist
+from board import WIDTH, HEIGHT
+from features2 import (DELLACHERIE_FEATURES, GAMEOVER_FEATURES, eroded_piece_cells,
+    col_transitions, row_transitions, holes, landing_height, cumulative_wells)
+
+_COLUMN_BITS = 1 << np.arange(WIDTH)
+# most moves any tetromino has
+MAX_MOVES = max(len(list(legal_moves(t))) for t in tetlist)
+
+def afterstates(state : TetrisGameState):
+    '''
+    returns (moves, boards, gameover) where boards[i] is the (HEIGHT, WIDTH)
+    occupancy after moves[i] (row 0 at the bottom, empty if the move ends the game)
+    '''
+    moves = list(state.get_moves())
+    rows = np.zeros((len(moves), HEIGHT), dtype=np.int64)
+    gameover = np.zeros(len(moves), dtype=bool)
+    for i, (orient, col) in enumerate(moves):
+        context = state.move_context(orient, col)
+        if context.gameover:
+            gameover[i] = True
+        else:
+            rows[i] = context.board.row_masks()
+    boards = (rows[:, :, None] & _COLUMN_BITS) != 0
+    return moves, boards, gameover
+
+def board_feature_columns(boards):
+    '''
+    dict from feature function to its (N,) values for the move-agnostic features
+    of DELLACHERIE_FEATURES, given stacked afterstates
+    '''
+    n = len(boards)
+    # rows from the top down make "above" the same as "earlier along axis 1"
+    top_down = boards[:, ::-1, :]
+
+    # a hole is an empty cell with any block above it in the same column
+    filled_above = np.zeros_like(top_down)
+    filled_above[:, 1:, :] = np.logical_or.accumulate(top_down, axis=1)[:, :-1, :]
+    n_holes = np.count_nonzero(filled_above & ~top_down, axis=(1, 2))
+
+    row_trans = np.count_nonzero(boards[:, :, 1:] != boards[:, :, :-1], axis=(1, 2))
+    col_trans = np.count_nonzero(boards[:, 1:, :] != boards[:, :-1, :], axis=(1, 2))
+
+    # a well cell is empty with a block or the wall on both sides
+    walled = np.pad(top_down, ((0, 0), (0, 0), (1, 1)), constant_values=True)
+    well = ~top_down & walled[:, :, :-2] & walled[:, :, 2:]
+    # depth of the well run each cell belongs to: count of well cells so far
+    # minus the count at the last non-well cell above it
+    seen = np.cumsum(well, axis=1)
+    depth = seen - np.maximum.accumulate(np.where(well, 0, seen), axis=1)
+    wells = depth.reshape(n, -1).sum(axis=1)
+
+    return {
+        holes: n_holes / 200,
+        row_transitions: row_trans,
+        col_transitions: col_trans,
+        cumulative_wells: wells
+    }
+
+def feature_matrix(state : TetrisGameState, features=DELLACHERIE_FEATURES):
+    '''
+    returns (moves, X) where X[i, j] = features[j](state, *moves[i]).
+    features outside DELLACHERIE_FEATURES are still computed one move at a time
+    '''
+    moves, boards, gameover = afterstates(state)
+    columns = board_feature_columns(boards)
+    move_values = {landing_height: [], eroded_piece_cells: []}
+    for orient, col in moves:
+        move_values[landing_height].append(landing_height(state, orient, col))
+        move_values[eroded_piece_cells].append(eroded_piece_cells(state, orient, col))
+    columns.update(move_values)
+
+    X = np.empty((len(moves), len(features)), dtype=np.float64)
+    for j, f in enumerate(features):
+        if f in columns:
+            X[:, j] = columns[f]
+            X[gameover, j] = GAMEOVER_FEATURES[DELLACHERIE_FEATURES.index(f)]
+        else:
+            X[:, j] = [f(state, orient, col) for orient, col in moves]
+    return moves, X
+
+def padded_feature_matrix(state : TetrisGameState, features=DELLACHERIE_FEATURES):
+    '''
+    returns (moves, X, mask) like feature_matrix, but with X padded with zeros
+    to MAX_MOVES rows and mask[i] true for the rows that are real moves, so that
+    every position gives arrays of the same shape
+    '''
+    moves, X = feature_matrix(state, features)
+    padded = np.zeros((MAX_MOVES, len(features)), dtype=np.float32)
+    padded[:len(moves)] = X
+    return moves, padded, np.arange(MAX_MOVES) < len(moves)
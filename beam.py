@@ -0,0 +1,85 @@
+'''
+beam search over several pieces. each ply drops that ply's piece on every board
+in the beam and keeps the `width` best afterstates, scored by the sum of
+DellacherieAgent scores along their line. the pieces are the current one,
+next_tet and then pieces sampled from what's left of the 7-bag
+'''
+import heapq
+import random
+
+from state import TetrisGameState, legal_moves, afterstate
+from board import TetrisBoard
+from tetrominoes import Tetromino, tetlist
+from dellacherie import DellacherieAgent
+
+class BeamSearchAgent(DellacherieAgent):
+
+    agent_name = 'beam search with Dellacherie\'s weights'
+
+    # afterstates kept per ply
+    width = 8
+    # pieces placed per line, counting the current one and next_tet
+    depth = 3
+
+    def __init__(self, logger):
+        super().__init__(logger)
+        self.rng = random.Random(0)
+        self.nodes = 0
+        self.merged = 0
+
+    def sample_pieces(self, state : TetrisGameState, n) -> 'list[Tetromino]':
+        '''
+        n pieces that could follow next_tet, drawn from the rest of the bag and
+        then from new bags
+        '''
+        bag = list(state.tet_iq)
+        pieces = []
+        for _ in range(n):
+            if not bag:
+                bag = list(range(len(tetlist)))
+            pieces.append(tetlist[bag.pop(self.rng.randrange(len(bag)))])
+        return pieces
+
+    def beam_search(self, state : TetrisGameState) -> 'list[tuple[float, tuple[int, int], TetrisBoard]]':
+        '''
+        the final beam as (score, first move, board), best first
+        '''
+        weights = self.fused_weights()
+        pieces = [state.tet, state.next_tet][:self.depth]
+        pieces += self.sample_pieces(state, self.depth - len(pieces))
+
+        beam = [(0.0, None, state.board)]
+        for ply, tet in enumerate(pieces):
+            # afterstates by board hash, so lines that reach the same board share a slot
+            candidates = {}
+            for total, first, board in beam:
+                for orient, col in legal_moves(tet):
+                    if ply == 0:
+                        context = state.move_context(orient, col)
+                    else:
+                        context = afterstate(board, tet, orient, col)
+                    self.nodes += 1
+                    if context.gameover:
+                        continue
+                    score = total + self.afterstate_score(context, tet[orient], weights)
+                    key = context.board.zobrist_hash()
+                    if key in candidates:
+                        self.merged += 1
+                        if candidates[key][0] >= score:
+                            continue
+                    candidates[key] = (score, first or (orient, col), context.board)
+            if not candidates:
+                break
+            beam = heapq.nlargest(self.width, candidates.values(), key=lambda c: c[0])
+        return beam
+
+    def get_best_move(self, state: TetrisGameState) -> 'tuple[int, int]':
+        _, first, _ = self.beam_search(state)[0]
+        if first is None:
+            # every move ends the game
+            return next(state.get_moves())
+        return first
+
+    def monitor(self):
+        out = f'width = {self.width}, depth = {self.depth}\n'
+        return out + f'afterstates evaluated = {self.nodes}, merged by hash = {self.merged}'
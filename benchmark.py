@@ -0,0 +1,237 @@
+'''
+benchmark suite for the board, feature and agent hot paths.
+
+every benchmark is timed on a set of fixed, seeded positions and the results are
+written to a json file. pass a previous results file as --baseline to fail the
+run when anything got slower than --threshold allows:
+
+    python3 benchmark.py --output before.json
+    ...
+    python3 benchmark.py --output after.json --baseline before.json --threshold 0.2
+'''
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+from timeit import default_timer as timer
+
+from state import TetrisGameState
+from board import GameOver, TetrisBoard, WIDTH, HEIGHT, FULL_ROW
+from dellacherie import DellacherieAgent
+import features
+import features2
+from batch_features import feature_matrix
+from evaluate import load_agent
+
+# fixtures
+
+def empty_state(seed=0):
+    return TetrisGameState(seed=seed)
+
+def midgame_state(seed=0, pieces=30):
+    '''
+    state reached by letting DellacherieAgent play `pieces` pieces of a seeded game
+    '''
+    state = TetrisGameState(seed=seed)
+    agent = DellacherieAgent(None)
+    for _ in range(pieces):
+        try:
+            state.make_move(*agent.get_best_move(state))
+        except GameOver:
+            break
+    return state
+
+def garbage_state(seed, rows, gaps):
+    '''
+    state with `rows` rows of garbage at the bottom, each missing `gaps` random blocks
+    '''
+    rng = random.Random(seed)
+    state = empty_state(seed)
+    masks = [0] * HEIGHT
+    for y in range(rows):
+        masks[y] = FULL_ROW
+        for x in rng.sample(range(WIDTH), gaps):
+            masks[y] &= ~(1 << x)
+    state.board = TetrisBoard.from_row_masks(masks)
+    return state
+
+def near_death_state(seed=0):
+    return garbage_state(seed, rows=HEIGHT - 4, gaps=1)
+
+def holes_state(seed=0):
+    return garbage_state(seed, rows=HEIGHT // 2, gaps=3)
+
+FIXTURES = {
+    'empty': empty_state,
+    'midgame': midgame_state,
+    'near_death': near_death_state,
+    'holes': holes_state,
+}
+
+# benchmarks: each takes a state and does one round of work over every move
+
+def all_moves(f):
+    def bench(state):
+        for orient, col in state.get_moves():
+            f(state, orient, col)
+    return bench
+
+def dry_run(state, orient, col):
+    state.board.place_tetromino(state.tet, orient, col, dry_run=True)
+
+def place(state, orient, col):
+    try:
+        state.board.copy(colors=False).place_tetromino(state.tet, orient, col)
+    except GameOver:
+        pass
+
+def test_place(state, orient, col):
+    try:
+        state.board.test_place_tetromino(state.tet, orient, col)
+    except GameOver:
+        pass
+
+def apply_undo(state, orient, col):
+    try:
+        state.board.undo(state.board.apply(state.tet, orient, col))
+    except GameOver:
+        pass
+
+def q474_feature(f):
+    def bench(state, orient, col):
+        context = state.move_context(orient, col)
+        f(state, orient, col, {'gameover': context.gameover, 'dummy': context.board,
+            'cleared': context.cleared, 'yi': context.yi})
+    return bench
+
+BENCHMARKS = {
+    'board.place_tetromino(dry_run)': all_moves(dry_run),
+    'board.place_tetromino': all_moves(place),
+    'board.test_place_tetromino': all_moves(test_place),
+    'board.apply+undo': all_moves(apply_undo),
+    'state.move_context': all_moves(TetrisGameState.move_context),
+}
+BENCHMARKS.update({f'features.{f.__name__}': all_moves(q474_feature(f)) for f in (
+    features.relative_cur_col_height, features.lines_cleared, features.contact,
+    features.holes_per_block, features.height_per_block, features.n_new_holes,
+    features.density, features.surface_area)})
+BENCHMARKS.update({f'features2.{f.__name__}': all_moves(f) for f in features2.DELLACHERIE_FEATURES})
+BENCHMARKS['features2.dellacherie_features'] = all_moves(features2.dellacherie_features)
+BENCHMARKS['batch_features.feature_matrix'] = feature_matrix
+
+# agents are benchmarked on a full decision, with every cache they keep cleared
+AGENTS = ['dellacherie', 'dellacherie_lookahead', 'expectimax', 'beam', 'q474', 'deepq', 'deepq_exp']
+
+def agent_benchmark(agent):
+    def bench(state):
+        table = getattr(agent, 'transposition_table', None)
+        if table is not None:
+            table.clear()
+        agent.get_best_move(state)
+    return bench
+
+def load_agent_benchmarks(names):
+    for name in names:
+        try:
+            BENCHMARKS[f'agent.{name}.get_best_move'] = agent_benchmark(load_agent(name))
+        except ImportError as e:
+            print(f'skipping agent {name}: {e}', file=sys.stderr)
+
+def time_benchmark(bench, state, min_time=0.05, rounds=5):
+    '''
+    best time per call of bench(state) over several rounds, with the state's
+    move context cache cleared before each call
+    '''
+    state.invalidate_move_contexts()
+    bench(state)
+    calls = 1
+    while True:
+        start = timer()
+        for _ in range(calls):
+            state.invalidate_move_contexts()
+            bench(state)
+        elapsed = timer() - start
+        if elapsed >= min_time:
+            break
+        calls *= 2
+    best = elapsed / calls
+    for _ in range(rounds - 1):
+        start = timer()
+        for _ in range(calls):
+            state.invalidate_move_contexts()
+            bench(state)
+        best = min(best, (timer() - start) / calls)
+    return best
+
+def run(names, fixtures, min_time=0.05):
+    results = {}
+    for fixture in fixtures:
+        state = FIXTURES[fixture]()
+        for name in names:
+            seconds = time_benchmark(BENCHMARKS[name], state, min_time)
+            results[f'{name}/{fixture}'] = seconds
+            print(f'{name:40} {fixture:12} {seconds*1e6:12.1f} us', flush=True)
+    return results
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+            text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline, threshold):
+    '''
+    print how each result changed against baseline and return the names of the
+    ones that got slower by more than threshold (a fraction)
+    '''
+    regressions = []
+    for key, seconds in results.items():
+        if key not in baseline:
+            continue
+        ratio = seconds / baseline[key]
+        flag = ''
+        if ratio > 1 + threshold:
+            regressions.append(key)
+            flag = '  <-- slower'
+        print(f'{key:53} {ratio:6.2f}x{flag}')
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', default='benchmark.json')
+    parser.add_argument('--baseline', default=None, help='results file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.25,
+        help='largest allowed slowdown against the baseline, as a fraction')
+    parser.add_argument('--filter', default='', help='only run benchmarks with this in their name')
+    parser.add_argument('--fixtures', nargs='+', default=list(FIXTURES), choices=FIXTURES)
+    parser.add_argument('--agents', nargs='*', default=AGENTS, help='agents to time get_best_move for')
+    parser.add_argument('--min-time', type=float, default=0.05,
+        help='seconds each timing round should take at least')
+    args = parser.parse_args()
+
+    load_agent_benchmarks(args.agents)
+    names = [name for name in BENCHMARKS if args.filter in name]
+    results = run(names, args.fixtures, args.min_time)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'results': results
+        }, f, indent=2)
+    print(f'wrote {args.output}')
+
+    if args.baseline is not None:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        print(f'=== against {args.baseline} (revision {baseline.get("revision")}) ===')
+        regressions = compare(results, baseline['results'], args.threshold)
+        if regressions:
+            print(f'{len(regressions)} benchmark(s) more than {args.threshold:.0%} slower than the baseline')
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
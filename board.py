@@ -1,11 +1,31 @@
 import itertools as it
-from copy import deepcopy
+import random
 from lib import render_block, render_block_curses, color_attrs
 from tetrominoes import Tetromino, OrientedTetromino
 
 HEIGHT = 20
 WIDTH = 10
 SCORE_MAP = [0, 40, 100, 300, 1200]
+FULL_ROW = (1 << WIDTH) - 1
+EMPTY_LETTERS = ' ' * WIDTH
+# stands in for the letter of blocks on boards that don't keep colors
+UNCOLORED = '#'
+
+# one random key per cell; a board's hash is the xor of the keys of its blocks.
+# seeded so hashes are the same in every process
+_zobrist_rng = random.Random(0x5121E7)
+ZOBRIST_KEYS = [[_zobrist_rng.getrandbits(64) for x in range(WIDTH)] for y in range(HEIGHT)]
+
+def zobrist_row(y, mask):
+    '''
+    xor of the keys of the blocks of mask on row y
+    '''
+    keys = ZOBRIST_KEYS[y]
+    h = 0
+    while mask:
+        h ^= keys[(mask & -mask).bit_length() - 1]
+        mask &= mask - 1
+    return h
 
 class GameOver(Exception):
     pass
@@ -14,43 +34,101 @@ class IllegalMove(Exception):
     pass
 
 class TetrisBoard:
-    def __init__(self):
-        self._board = [[0 for x in range(WIDTH)] for y in range(HEIGHT)]
+    '''
+    occupancy is kept as one integer bitmask per row (bottom row first, bit x set
+    if column x is filled). the letters of the placed blocks are only needed to
+    color the curses UI, so boards made for move evaluation can skip them
+    (see copy(colors=False))
+
+    the height of each column (one more than its highest block) is kept up to
+    date as pieces are placed so landing rows can be found without dropping the
+    piece one row at a time.
+
+    a zobrist hash of the occupancy is updated with every placement so equal
+    positions can be recognised cheaply (see zobrist_hash)
+    '''
+
+    def __init__(self, colors=True):
+        self._rows = [0] * HEIGHT
+        self._heights = [0] * WIDTH
+        self._hash = 0
+        self._letters = [EMPTY_LETTERS] * HEIGHT if colors else None
+
+    @classmethod
+    def from_row_masks(cls, rows):
+        '''
+        uncolored board with the given occupancy bitmask for each row, bottom row first
+        '''
+        #pylint: disable=protected-access
+        board = cls(colors=False)
+        board._rows = [int(row) for row in rows]
+        board._update_heights()
+        board._rehash()
+        return board
+
+    def to_dict(self):
+        return {'rows': list(self._rows), 'letters': self._letters and list(self._letters)}
+
+    @classmethod
+    def from_dict(cls, d):
+        #pylint: disable=protected-access
+        board = cls.from_row_masks(d['rows'])
+        if d['letters'] is not None:
+            board._letters = list(d['letters'])
+        return board
 
     def __getitem__(self, slc) -> bool:
+        # negative indexes wrap around like they did when rows were lists
+        x, y = slc
+        if not -WIDTH <= x < WIDTH:
+            return False
         try:
-            ret = self._board[slc[1]][slc[0]]
+            row = self._rows[y]
         except IndexError:
-            ret = 0
-        return bool(ret)
+            return False
+        return bool(row >> (x % WIDTH) & 1)
 
     def __repr__(self):
         return 'TetrisBoard'
 
     def __str__(self):
         s = ''
-        for row in reversed(self._board):
-            for block in row:
-                s += render_block(block)
+        for y in reversed(range(HEIGHT)):
+            for x in range(WIDTH):
+                s += render_block(self.letter(x, y))
             s += '\n'
         return s[:-1]
 
+    def letter(self, x, y):
+        '''
+        letter of the tetromino the block at (x, y) came from, 0 if empty
+        '''
+        if not self._rows[y] >> x & 1:
+            return 0
+        if self._letters is None:
+            return UNCOLORED
+        return self._letters[y][x]
+
     def draw(self, scr, attrs=0):
         for i in range(HEIGHT):
             self.draw_line(scr, i, attrs)
 
-    def copy(self):
+    def copy(self, colors=True):
         #pylint: disable=protected-access
-        ret = TetrisBoard()
-        ret._board = deepcopy(self._board)
+        ret = TetrisBoard(colors=False)
+        ret._rows = self._rows[:]
+        ret._heights = self._heights[:]
+        ret._hash = self._hash
+        if colors and self._letters is not None:
+            ret._letters = self._letters[:]
         return ret
 
 
     def draw_line(self, scr, idx, attrs=0, autocolor=True):
         yi = HEIGHT - idx - 1
         x = 0
-        row = self._board[idx]
-        for block in row:
+        for bx in range(WIDTH):
+            block = self.letter(bx, idx)
             render_block_curses(block, scr, y=yi, x=x,
                     attrs=attrs, empty=not block, autocolor=autocolor)
             x += 2
@@ -64,51 +142,162 @@ class TetrisBoard:
             tet[orient].draw(scr, yi, col, empty=True)
     
     def get_cleared_lines(self):
-        clear_indexes = []
-        for i, line in enumerate(self._board):
-            if all(line):
-                clear_indexes.append(i)
-        return clear_indexes
+        return [i for i, row in enumerate(self._rows) if row == FULL_ROW]
 
     def remove_cleared_lines(self, clear_indexes):
-        #start clearing from the top so that indexes don't get messed up
-        for idx in reversed(clear_indexes):
-            del self._board[idx]
-            self._board.append([0 for x in range(WIDTH)])
+        if not clear_indexes:
+            return
+        cleared = set(clear_indexes)
+        kept = [i for i in range(HEIGHT) if i not in cleared]
+        self._rows = [self._rows[i] for i in kept] + [0] * len(cleared)
+        if self._letters is not None:
+            self._letters = [self._letters[i] for i in kept] + [EMPTY_LETTERS] * len(cleared)
+        self._update_heights()
+        # every block above a cleared line moved, so start the hash over
+        self._rehash()
+
+    def _rehash(self):
+        self._hash = 0
+        for y, row in enumerate(self._rows):
+            if row:
+                self._hash ^= zobrist_row(y, row)
+
+    def zobrist_hash(self):
+        '''
+        64 bit hash of which cells are filled. equal boards always hash the same
+        (even across processes), different boards collide with negligible probability
+        '''
+        return self._hash
+
+    def _update_heights(self):
+        # scan down from the top until every column has found its highest block
+        self._heights = [0] * WIDTH
+        remaining = FULL_ROW
+        y = HEIGHT - 1
+        while remaining and y >= 0:
+            found = self._rows[y] & remaining
+            remaining &= ~found
+            while found:
+                self._heights[(found & -found).bit_length() - 1] = y + 1
+                found &= found - 1
+            y -= 1
+
+    def row_masks(self):
+        '''
+        occupancy bitmask of each row, bottom row first
+        '''
+        return tuple(self._rows)
+
+    def column_heights(self):
+        '''
+        height of each column, i.e. one more than the y of its highest block
+        '''
+        return tuple(self._heights)
 
     @staticmethod 
     def score(clear_indexes):
         return SCORE_MAP[len(clear_indexes)]
         
     def can_descend(self, ot : OrientedTetromino, bx, by):
-        for x, y in ot.offsets():
-            # print(self[x, y], board[bx + x, by + y - 1])
-            if ot[x, y] and self[bx + x, by + y - 1]:
+        for x, y in ot.cells:
+            if self[bx + x, by + y - 1]:
                 return False
         return True
 
+    def landing_row(self, ot : OrientedTetromino, col):
+        '''
+        row where the bottom of ot ends up when dropped at col
+        '''
+        cur_y = 0
+        for dx, skirt in enumerate(ot.skirt):
+            if col + dx < WIDTH and self._heights[col + dx] - skirt > cur_y:
+                cur_y = self._heights[col + dx] - skirt
+        return cur_y
+
     def place_tetromino(self, t : Tetromino, orientation, col, dry_run=False):
-        cur_y = HEIGHT
         ot = t[orientation]
-        while cur_y > 0 and self.can_descend(ot, col, cur_y):
-            cur_y -= 1
+        cur_y = self.landing_row(ot, col)
         if dry_run:
             return cur_y
-        for x, y in ot.offsets():
-            if ot[x, y]:
-                if col + x >= WIDTH:
-                    raise IllegalMove
-                if cur_y + y >= HEIGHT:
-                    raise GameOver
-                self._board[cur_y + y][col + x] = t.letter
+        if col + ot.width > WIDTH:
+            raise IllegalMove
+        if cur_y + ot.height > HEIGHT:
+            raise GameOver
+        for y, mask in enumerate(ot.row_masks):
+            self._rows[cur_y + y] |= mask << col
+            self._hash ^= zobrist_row(cur_y + y, mask << col)
+        for dx, top in enumerate(ot.top):
+            self._heights[col + dx] = cur_y + top + 1
+        if self._letters is not None:
+            for x, y in ot.cells:
+                letters = self._letters[cur_y + y]
+                self._letters[cur_y + y] = letters[:col + x] + t.letter + letters[col + x + 1:]
         return cur_y
 
     def test_place_tetromino(self, t: Tetromino, orient, col):
-        board = self.copy()
+        board = self.copy(colors=False)
         yi = board.place_tetromino(t, orient, col)
         cleared = board.get_cleared_lines()
         board.remove_cleared_lines(cleared)
         return board, yi, cleared
 
+    def apply(self, t : Tetromino, orient, col):
+        '''
+        place t and clear any full lines in place, for scoring a placement
+        without copying the board. returns an undo record for undo(), whose
+        first two items are the landing row and the indexes of the cleared
+        lines. raises GameOver (or IllegalMove) without touching the board if
+        the piece doesn't fit
+        '''
+        ot = t[orient]
+        yi = self.landing_row(ot, col)
+        if col + ot.width > WIDTH:
+            raise IllegalMove
+        if yi + ot.height > HEIGHT:
+            raise GameOver
+        rows = self._rows
+        old_hash = self._hash
+        h = old_hash
+        for y, mask in enumerate(ot.row_masks):
+            rows[yi + y] |= mask << col
+            h ^= zobrist_row(yi + y, mask << col)
+        self._hash = h
+        heights = self._heights
+        # only the columns the piece covers change height
+        old_heights = heights[col:col + ot.width]
+        for dx, top in enumerate(ot.top):
+            heights[col + dx] = yi + top + 1
+        old_letters = None
+        if self._letters is not None:
+            old_letters = self._letters[yi:yi + ot.height]
+            for x, y in ot.cells:
+                letters = self._letters[yi + y]
+                self._letters[yi + y] = letters[:col + x] + t.letter + letters[col + x + 1:]
+        # only rows the piece landed in can have filled up
+        cleared = [yi + y for y in range(ot.height) if rows[yi + y] == FULL_ROW]
+        removed = None
+        if cleared:
+            # clearing builds new rows, letters and heights lists, so undo can
+            # just put the old ones back
+            removed = (self._rows, self._letters, self._heights)
+            self.remove_cleared_lines(cleared)
+        return yi, cleared, col, ot, old_hash, old_heights, old_letters, removed
+
+    def undo(self, record):
+        '''
+        reverse the apply() call that returned record. records have to be
+        undone in the opposite order they were applied
+        '''
+        yi, _, col, ot, old_hash, old_heights, old_letters, removed = record
+        if removed is not None:
+            self._rows, self._letters, self._heights = removed
+        rows = self._rows
+        for y, mask in enumerate(ot.row_masks):
+            rows[yi + y] &= ~(mask << col)
+        self._heights[col:col + ot.width] = old_heights
+        if old_letters is not None:
+            self._letters[yi:yi + ot.height] = old_letters
+        self._hash = old_hash
+
     def coords(self):
         return it.product(range(WIDTH), range(HEIGHT))
\ No newline at end of file
@@ -0,0 +1,152 @@
+'''
+cross-entropy method search for DellacherieAgent weights over the features2
+features. every generation samples weight vectors from a gaussian, plays each of
+them on the same seeded games across a process pool, and refits the gaussian to
+the best of them. after each generation everything is written to the checkpoint,
+which DellacherieAgent.load_weights (and so evaluate.py --weights) can read:
+
+    python3 cem.py --generations 20 --population 40 --games 4 --max-pieces 1000 --workers 4
+    python3 evaluate.py dellacherie --weights cem.json
+
+pass --resume to pick a run back up from its checkpoint
+'''
+import argparse
+import json
+import os
+import statistics
+from multiprocessing import Pool
+from timeit import default_timer as timer
+
+import numpy as np
+
+from board import GameOver
+from state import TetrisGameState
+from dellacherie import DellacherieAgent
+from features2 import DELLACHERIE_FEATURES
+from transposition import TranspositionTable
+
+FEATURES = DELLACHERIE_FEATURES
+
+# each worker process reuses one agent for every candidate it plays
+_agent = None
+
+def play_candidate(task):
+    '''
+    mean lines cleared by DellacherieAgent with the given weights over the
+    given seeds, stopping each game after max_pieces pieces
+    '''
+    global _agent #pylint: disable=global-statement
+    weights, seeds, max_pieces = task
+    if _agent is None:
+        _agent = DellacherieAgent(None)
+        # every candidate has new weights, so there's nothing to gain from a big table
+        _agent.transposition_table = TranspositionTable(size=256)
+    _agent.weights = dict(zip(FEATURES, weights))
+    lines = []
+    for seed in seeds:
+        state = TetrisGameState(seed=seed)
+        cleared = 0
+        for _ in range(max_pieces):
+            try:
+                _, _, rows = state.make_move(*_agent.get_best_move(state))
+            except GameOver:
+                break
+            cleared += len(rows)
+        lines.append(cleared)
+    return statistics.mean(lines)
+
+def named(weights):
+    return {f.__name__: float(w) for f, w in zip(FEATURES, weights)}
+
+def save_checkpoint(filename, checkpoint):
+    # written to the side and moved into place, so an interrupted write can't lose the last one
+    with open(filename + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(filename + '.tmp', filename)
+
+def new_checkpoint(init_std):
+    return {
+        'features': [f.__name__ for f in FEATURES],
+        'generation': 0,
+        'mean': [0.0] * len(FEATURES),
+        'std': [init_std] * len(FEATURES),
+        'weights': named([0.0] * len(FEATURES)),
+        'best': None,
+        'history': []
+    }
+
+def run(checkpoint, filename, generations, population, elite, games, max_pieces, workers,
+        noise, seed=0):
+    '''
+    run generations more generations of the search in checkpoint, saving it to
+    filename after each one
+    '''
+    rng = np.random.default_rng([seed, checkpoint['generation']])
+    mean = np.array(checkpoint['mean'])
+    std = np.array(checkpoint['std'])
+    with Pool(workers) as pool:
+        for _ in range(generations):
+            generation = checkpoint['generation']
+            start = timer()
+            candidates = rng.normal(mean, std, size=(population, len(FEATURES)))
+            # every candidate plays the same games, so they're compared on equal terms
+            seeds = [seed + generation * games + i for i in range(games)]
+            tasks = [(tuple(c), seeds, max_pieces) for c in candidates]
+            scores = np.array(pool.map(play_candidate, tasks))
+
+            order = np.argsort(scores)[::-1]
+            elites = candidates[order[:elite]]
+            mean = elites.mean(axis=0)
+            # extra noise that shrinks over the generations keeps the search from collapsing too early
+            std = np.sqrt(elites.var(axis=0) + max(noise - generation * noise / 10, 0))
+
+            best = order[0]
+            if checkpoint['best'] is None or scores[best] > checkpoint['best']['lines']:
+                checkpoint['best'] = {'generation': generation, 'lines': float(scores[best]),
+                    'weights': named(candidates[best])}
+            checkpoint['history'].append({
+                'generation': generation,
+                'lines_mean': float(scores.mean()),
+                'lines_elite': float(scores[order[:elite]].mean()),
+                'lines_best': float(scores[best]),
+                'seconds': timer() - start
+            })
+            checkpoint.update(generation=generation + 1, mean=mean.tolist(), std=std.tolist(),
+                weights=named(mean))
+            save_checkpoint(filename, checkpoint)
+            print(f'generation {generation}: lines mean {scores.mean():.1f}, elite '
+                f'{scores[order[:elite]].mean():.1f}, best {scores[best]:.1f} '
+                f'({timer() - start:.1f}s)', flush=True)
+            print('    mean weights: ' + ', '.join(f'{k} {v:.2f}' for k, v in named(mean).items()), flush=True)
+    return checkpoint
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--checkpoint', default='cem.json')
+    parser.add_argument('--resume', action='store_true', help='carry on from the checkpoint')
+    parser.add_argument('--generations', type=int, default=10)
+    parser.add_argument('--population', type=int, default=40)
+    parser.add_argument('--elite', type=int, default=None, help='candidates refit to, a quarter by default')
+    parser.add_argument('--games', type=int, default=4, help='games played per candidate')
+    parser.add_argument('--max-pieces', type=int, default=1000, help='stop games after this many pieces')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--std', type=float, default=10.0, help='starting standard deviation of the weights')
+    parser.add_argument('--noise', type=float, default=4.0, help='variance added to the refit gaussian at first')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.resume:
+        with open(args.checkpoint, encoding='utf-8') as f:
+            checkpoint = json.load(f)
+        if checkpoint['features'] != [f.__name__ for f in FEATURES]:
+            raise ValueError(f'{args.checkpoint} was made with different features')
+    else:
+        checkpoint = new_checkpoint(args.std)
+
+    run(checkpoint, args.checkpoint, args.generations, args.population, args.elite or max(args.population // 4, 1),
+        args.games, args.max_pieces, args.workers, args.noise, args.seed)
+    print(f'best candidate: {checkpoint["best"]["lines"]:.1f} lines in generation {checkpoint["best"]["generation"]}')
+    print(f'wrote {args.checkpoint}')
+
+if __name__ == '__main__':
+    main()
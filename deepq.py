@@ -1,7 +1,9 @@
 import logging
 from typing import Callable
 import random
+from timeit import default_timer as timer
 
+import numpy as np
 import tensorflow as tf
 from tensorflow import keras
 from keras import layers
@@ -10,8 +12,11 @@ from board import WIDTH, GameOver, TetrisBoard
 
 from base_agent import BaseTetrisAgent
 from state import TetrisGameState
+from batch_features import feature_matrix, padded_feature_matrix
+from numpy_q import export_npz
+from q_learner import compiled_train_step, no_next_moves
 from features2 import (eroded_piece_cells, col_transitions, row_transitions,
-    holes, landing_height, cumulative_wells)
+    holes, landing_height, cumulative_wells, feature_vector)
 
 class DeepQAgent(BaseTetrisAgent):
 
@@ -43,10 +48,15 @@ class DeepQAgent(BaseTetrisAgent):
         self.iterations = 0
         self.logger = logger
 
-        self.avg_loss = 0
+        self.avg_loss = tf.Variable(0.)
         self.epoch_iters = 0
+        self.train_time = 0
         self.epochs = 0
         self.games = 0
+        self.learn = compiled_train_step(self.model, self.target_model, self.optimizer,
+            self.discount_rate, self.avg_loss)
+        self.decisions = 0
+        self.decision_time = 0
 
     def create_model(self):
         inputs = layers.Input(shape=(len(self.features),))
@@ -62,71 +72,60 @@ class DeepQAgent(BaseTetrisAgent):
             return self.get_best_move(state)
     
     def get_q_value(self, state : TetrisGameState, orient, col):
-        inputs = [f(state, orient, col) for f in self.features]
+        inputs = feature_vector(state, orient, col, self.features)
         inputs = tf.expand_dims(tf.convert_to_tensor(inputs), axis=0)
         return self.model(inputs)[0]
         
     def get_best_move(self, state : TetrisGameState) -> 'tuple[int, int]':
-        move_q_values = {(orient, col): self.get_q_value(state, orient, col) for orient, col in state.get_moves()}
-        return max(move_q_values, key=lambda m: move_q_values[m])
+        start = timer()
+        moves, moves_input_set = feature_matrix(state, self.features)
+        # q values of every move in one batch
+        q_values = tf.squeeze(self.model(tf.convert_to_tensor(moves_input_set)), axis=1)
+        best = moves[int(tf.math.argmax(q_values))]
+        self.decisions += 1
+        self.decision_time += timer() - start
+        return best
     
     def train_step(self, state : TetrisGameState):
+        start = timer()
         self.epoch_iters += 1
         self.iterations += 1
         # copy q model to target model
         if self.iterations % self.copy_iterations == 0:
             self.target_model.set_weights(self.model.get_weights())
-        
-        with tf.GradientTape() as tape:
-            orient, col = self.choose_action(state)
-            #q value of chosen action
-            q_observed = self.get_q_value(state, orient, col)
 
-            if random.random() < 0.01:
-                self.logger.log(logging.DEBUG, f'random q value: {q_observed}')
-            try:
-                dummy, _, cleared = state.board.test_place_tetromino(state.tet, orient, col)
-                gameover = False
-                reward = state.board.score(cleared)
-            except GameOver:
-                gameover = True
-                #penalize game over a little
-                reward = -10
-            
-            
-            # calculate estimate of q value based on reward and q of best action in next state
-            if gameover:
-                best_next_q_value = 0
-            else:
-                next_state = TetrisGameState()
-                next_state.board = dummy
-                next_state.tet = state.next_tet
-                next_q_values = {}
-                for o, c in next_state.get_moves():
-                    inputs = [f(next_state, o, c) for f in self.features]
-                    inputs = tf.expand_dims(tf.convert_to_tensor(inputs), axis=0)
-                    next_q_values[(o, c)] = self.target_model(inputs)[0]
-                best_next_q_value = max(next_q_values.values())
-            
-            q_estimate = reward + self.discount_rate * best_next_q_value
-            #loss can be factored out--use model.compile(loss=keras.losses{DESIRED_LOSS_FUNCTION}) and call it using self.loss_function
-            loss = (q_observed - q_estimate)**2
-            
-        grads = tape.gradient(loss, self.model.trainable_variables)
-        self.optimizer.apply_gradients(zip(grads, self.model.trainable_variables))
-        
-        self.avg_loss = (self.avg_loss*(self.epoch_iters-1)/self.epoch_iters) + loss / self.epoch_iters
-        
+        orient, col = self.choose_action(state)
+        inputs = np.array([feature_vector(state, orient, col, self.features)], dtype=np.float32)
+        if random.random() < 0.01:
+            self.logger.log(logging.DEBUG, f'random q value: {self.model(inputs)[0]}')
+        gameover, dummy, _, cleared = state.move_context(orient, col)
+        if gameover:
+            #penalize game over a little
+            reward = -10
+            next_inputs, next_mask = no_next_moves(len(self.features))
+        else:
+            reward = state.board.score(cleared)
+            next_state = TetrisGameState()
+            next_state.board = dummy
+            next_state.tet = state.next_tet
+            _, next_inputs, next_mask = padded_feature_matrix(next_state, self.features)
+
+        # q estimate from the reward and the target model's best next move,
+        # gradient step and running loss, all in one graph call
+        self.learn(inputs, np.array([reward], dtype=np.float32), next_inputs[None], next_mask[None],
+            np.ones(1, dtype=np.float32), np.float32(self.epoch_iters))
+        self.train_time += timer() - start
         return orient, col
-    
+
     def monitor(self):
         out = f'epoch = {self.epochs}\n'
         out += f'games played = {self.games}\n'
         out += f'train steps = {self.iterations}\n'
-        try:
-            out += f'average loss this epoch = {self.avg_loss}'
-        except ZeroDivisionError:
-            pass
+        if self.decisions:
+            out += f'mean decision latency = {self.decision_time / self.decisions * 1000:.2f} ms\n'
+        if self.train_time:
+            out += f'train steps/s this epoch = {self.epoch_iters / self.train_time:.1f}\n'
+        out += f'average loss this epoch = {float(self.avg_loss):.4f}'
         return out
     
     def save_weights(self, filename):
@@ -137,14 +136,21 @@ class DeepQAgent(BaseTetrisAgent):
             self.model.load_weights(filename)
         except tf.errors.NotFoundError:
             raise FileNotFoundError
+
+    def export_npz(self, filename):
+        '''
+        write the model to filename for NumpyQAgent, which plays it without tensorflow
+        '''
+        export_npz(self.model, self.features, filename)
     
     def train(self, iters):
-        self.avg_loss = 0
+        self.avg_loss.assign(0.)
         self.epoch_iters = 0
+        self.train_time = 0
         self.epochs += 1
         for _ in range(iters):
             self.logger.log(logging.DEBUG, f'running new tetris game! iterations={self.iterations}')
-            s = TetrisGameState()
+            s = self.training_state()
             while True:
                 # self.logger.log(logging.DEBUG, 'start train step')
                 orient, col = self.train_step(s)
@@ -154,4 +160,4 @@ class DeepQAgent(BaseTetrisAgent):
                 except GameOver:
                     self.games += 1
                     break
-            self.logger.log(logging.DEBUG, f'average loss={self.avg_loss}')
\ No newline at end of file
+            self.logger.log(logging.DEBUG, f'average loss={float(self.avg_loss)}')
\ No newline at end of file
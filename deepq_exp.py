@@ -1,8 +1,10 @@
 import logging
+import os
 from typing import Callable
 import random
-from collections import deque
+from timeit import default_timer as timer
 
+import numpy as np
 import tensorflow as tf
 from tensorflow import keras
 from keras import layers
@@ -11,8 +13,13 @@ from board import WIDTH, GameOver, TetrisBoard
 
 from base_agent import BaseTetrisAgent
 from state import TetrisGameState
+from batch_features import feature_matrix
+from numpy_q import export_npz
+from q_learner import compiled_train_step
+from replay import ReplayBuffer, PrioritizedReplayBuffer
+from actors import ActorPool
 from features2 import (eroded_piece_cells, col_transitions, row_transitions,
-    holes, landing_height, cumulative_wells)
+    holes, landing_height, cumulative_wells, feature_vector)
 
 class DeepQExpReplayAgent(BaseTetrisAgent):
 
@@ -31,6 +38,17 @@ class DeepQExpReplayAgent(BaseTetrisAgent):
     exploration_prob = 0.05
     discount_rate = 0.9
     experience_buffer_size = 10000
+    # sample experiences by td error rather than uniformly
+    prioritized_replay = False
+    # with actors > 0, train() has that many actor processes play the games
+    # and only learns from their transitions here. they're sent the model's
+    # weights every weight_refresh learner steps
+    actors = 0
+    weight_refresh = 100
+    # with actors, at most this many learner steps are taken per transition
+    # received. when the actors produce more than the learner keeps up with,
+    # the extra steps are skipped rather than holding the actors back
+    replay_ratio = 0.25
     def __init__(
             self,
             logger,
@@ -43,12 +61,24 @@ class DeepQExpReplayAgent(BaseTetrisAgent):
         self.iterations = 0
         self.logger = logger
 
-        self.experiences = deque(maxlen=self.experience_buffer_size)
+        if self.prioritized_replay:
+            self.experiences = PrioritizedReplayBuffer(self.experience_buffer_size, len(self.features))
+        else:
+            self.experiences = ReplayBuffer(self.experience_buffer_size, len(self.features))
+        self.training_started = None
+        self.actor_pool = None
+        self.transitions = 0
+        self.actors_started = None
 
-        self.avg_loss = 0
+        self.avg_loss = tf.Variable(0.)
         self.epoch_iters = 0
+        self.train_time = 0
         self.epochs = 0
         self.games = 0
+        self.learn = compiled_train_step(self.model, self.target_model, self.optimizer,
+            self.discount_rate, self.avg_loss)
+        self.decisions = 0
+        self.decision_time = 0
 
     def create_model(self):
         inputs = layers.Input(shape=(len(self.features),))
@@ -64,28 +94,35 @@ class DeepQExpReplayAgent(BaseTetrisAgent):
             return self.get_best_move(state)
     
     def get_q_value(self, state : TetrisGameState, orient, col):
-        inputs = [f(state, orient, col) for f in self.features]
+        inputs = feature_vector(state, orient, col, self.features)
         inputs = tf.expand_dims(tf.convert_to_tensor(inputs), axis=0)
         return self.model(inputs)[0]
     
     def state_to_input(self, state, orient, col):
-        inputs = [f(state, orient, col) for f in self.features]
-        inputs = tf.convert_to_tensor(inputs, dtype=tf.float64)
-        return inputs
+        return np.array(feature_vector(state, orient, col, self.features), dtype=np.float32)
         
     def get_best_move(self, state : TetrisGameState) -> 'tuple[int, int]':
-        moves = list(state.get_moves())
-        moves_input_set = [self.state_to_input(state, o, c) for o, c in moves]
+        start = timer()
+        moves, moves_input_set = feature_matrix(state, self.features)
         #calculate q values in batch
         q_values = tf.squeeze(self.target_model(tf.convert_to_tensor(moves_input_set)))
         i = tf.math.argmax(q_values)
+        self.decisions += 1
+        self.decision_time += timer() - start
         return moves[i]
 
     def sample_experiences(self):
-        inputss, rewards, next_states = zip(*random.sample(self.experiences, self.minibatch_size))
-        return list(inputss), list(rewards), list(next_states)
-    
+        '''
+        returns (indices, weights, (inputs, rewards, next_inputs, next_mask)) for
+        a minibatch. weights are all 1 unless replay is prioritized
+        '''
+        if self.prioritized_replay:
+            return self.experiences.sample(self.minibatch_size)
+        indices = self.experiences.sample_indices(self.minibatch_size)
+        return indices, np.ones(self.minibatch_size, dtype=np.float32), self.experiences.batch(indices)
+
     def train_step(self, state : TetrisGameState):
+        start = timer()
         self.epoch_iters += 1
         self.iterations += 1
         
@@ -96,65 +133,82 @@ class DeepQExpReplayAgent(BaseTetrisAgent):
         # world interaction phase
         
         orient, col = self.choose_action(state)
-        #q value of chosen action
-        # q_observed = self.get_q_value(state, orient, col)
 
-        try:
-            dummy, _, cleared = state.board.test_place_tetromino(state.tet, orient, col)
-            gameover = False
-            reward = state.board.score(cleared)
-        except GameOver:
-            gameover = True
+        gameover, dummy, _, cleared = state.move_context(orient, col)
+        if gameover:
             #penalize game over a little
             reward = -10
+        else:
+            reward = state.board.score(cleared)
 
-        #experiences consist of F(state, action), reward, next state
+        #experiences consist of F(state, action), reward, and F of every move in the next state
         
         if gameover:
-            ns_moves_input_vec = None
+            next_inputs = None
         else:
             next_state = TetrisGameState()
             next_state.board = dummy
             next_state.tet = state.next_tet
-            ns_moves_input_vec = [self.state_to_input(next_state, o, c) for o, c in next_state.get_moves()]
-        self.experiences.append((self.state_to_input(state, orient, col), reward, ns_moves_input_vec))
+            _, next_inputs = feature_matrix(next_state, self.features)
+        self.experiences.add(self.state_to_input(state, orient, col), reward, next_inputs)
 
         # experience replay phase
         if len(self.experiences) < self.minibatch_size:
+            self.train_time += timer() - start
             return orient, col
 
-        with tf.GradientTape() as tape:
-            input_list, rewards, ns_movesets_as_input_vectors = self.sample_experiences()
-
-            # calculate estimates of q value based on reward and q of best action in next state
-            best_next_q_values = []
-            for iv in ns_movesets_as_input_vectors:
-                if iv is None:
-                    best_next_q_values.append(0)
-                else:
-                    #get q values of all next actions in one batch
-                    # moves_input_set = [self.state_to_input(ns, o, c) for o, c in ns.get_moves()]
-                    q_values = self.target_model(tf.convert_to_tensor(iv))
-                    #best q value of all moves possible in next state
-                    best_next_q_value = max(tf.squeeze(q_values))
-                    best_next_q_values.append(best_next_q_value)
-            
-            best_next_q_vec = tf.convert_to_tensor(best_next_q_values)
-            reward_vec = tf.convert_to_tensor(rewards, dtype=tf.float32)
-
-            q_observed_vec = tf.squeeze(self.model(tf.convert_to_tensor(input_list)))
-            
-            q_estimates_vec = reward_vec + self.discount_rate * best_next_q_vec
-
-            loss = (q_observed_vec - q_estimates_vec)**2
-            
-        grads = tape.gradient(loss, self.model.trainable_variables)
-        self.optimizer.apply_gradients(zip(grads, self.model.trainable_variables))
-
-        loss = tf.reduce_mean(loss)
-        self.avg_loss = tf.cast((self.avg_loss*(self.epoch_iters-1)/self.epoch_iters) + loss / self.epoch_iters, tf.float32)
-        
+        self.replay_step()
+        self.train_time += timer() - start
         return orient, col
+
+    def replay_step(self):
+        # q estimates from the target model, gradient step and running loss in one graph call
+        indices, weights, batch = self.sample_experiences()
+        td_errors = self.learn(*batch, weights, np.float32(self.epoch_iters))
+        if self.prioritized_replay:
+            self.experiences.update_priorities(indices, td_errors.numpy())
+
+    def learner_step(self):
+        '''
+        train_step without the world interaction, for transitions that come from actors
+        '''
+        start = timer()
+        self.epoch_iters += 1
+        self.iterations += 1
+        if self.iterations % self.copy_iterations == 0:
+            self.target_model.set_weights(self.model.get_weights())
+        if self.iterations % self.weight_refresh == 0:
+            self.actor_pool.publish(self.model.get_weights())
+        if len(self.experiences) >= self.minibatch_size:
+            self.replay_step()
+        self.train_time += timer() - start
+
+    def train_with_actors(self, iters):
+        '''
+        learn from the transitions of the next iters games the actors finish,
+        replay_ratio learner steps per transition at most
+        '''
+        if self.actor_pool is None:
+            self.actor_pool = ActorPool(self.actors, [f.__name__ for f in self.features],
+                [w.shape for w in self.model.get_weights()], seed=self.train_seed or 0,
+                exploration_prob=self.exploration_prob)
+            self.actor_pool.start(self.model.get_weights())
+            self.actors_started = timer()
+        games = 0
+        steps_owed = 0.0
+        while games < iters:
+            transitions, finished = self.actor_pool.get()
+            self.experiences.add_many(transitions)
+            self.transitions += len(transitions)
+            games += finished
+            self.games += finished
+            steps_owed += len(transitions) * self.replay_ratio
+            while steps_owed >= 1:
+                self.learner_step()
+                steps_owed -= 1
+                if self.actor_pool.waiting():
+                    # take in what's arrived first, and drop the steps still owed
+                    steps_owed = 0.0
     
     def monitor(self):
         out = ''
@@ -164,11 +218,19 @@ class DeepQExpReplayAgent(BaseTetrisAgent):
         out += f'epoch = {self.epochs}\n'
         out += f'games played = {self.games}\n'
         out += f'train steps = {self.iterations}\n'
-        out += f'experiences saved = {len(self.experiences)}\n'
-        try:
-            out += f'average loss this epoch = {self.avg_loss}'
-        except ZeroDivisionError:
-            pass
+        if self.actor_pool is not None:
+            out += f'actors = {self.actors}, transitions/s = {self.transitions / (timer() - self.actors_started):.0f}\n'
+            out += (f'learner steps per transition = {self.iterations / max(self.transitions, 1):.2f} '
+                f'(at most {self.replay_ratio})\n')
+        out += f'experiences saved = {len(self.experiences)}'
+        out += ' (prioritized)\n' if self.prioritized_replay else '\n'
+        if self.decisions:
+            out += f'mean decision latency = {self.decision_time / self.decisions * 1000:.2f} ms\n'
+        if self.training_started is not None:
+            out += f'training time = {timer() - self.training_started:.0f}s\n'
+        if self.train_time:
+            out += f'train steps/s this epoch = {self.epoch_iters / self.train_time:.1f}\n'
+        out += f'average loss this epoch = {float(self.avg_loss):.4f}'
         return out
     
     def save_weights(self, filename):
@@ -179,14 +241,27 @@ class DeepQExpReplayAgent(BaseTetrisAgent):
             self.model.load_weights(filename)
         except tf.errors.NotFoundError:
             raise FileNotFoundError
+
+    def export_npz(self, filename):
+        '''
+        write the model to filename for NumpyQAgent, which plays it without tensorflow
+        '''
+        export_npz(self.model, self.features, filename)
     
     def train(self, iters):
-        self.avg_loss = 0
+        if self.training_started is None:
+            self.training_started = timer()
+        self.avg_loss.assign(0.)
         self.epoch_iters = 0
+        self.train_time = 0
         self.epochs += 1
+        if self.actors:
+            self.train_with_actors(iters)
+            self.logger.log(logging.DEBUG, f'average loss={float(self.avg_loss)}')
+            return
         for _ in range(iters):
             self.logger.log(logging.DEBUG, f'running new tetris game! iterations={self.iterations}')
-            s = TetrisGameState()
+            s = self.training_state()
             while True:
                 # self.logger.log(logging.DEBUG, 'start train step')
                 orient, col = self.train_step(s)
@@ -196,4 +271,17 @@ class DeepQExpReplayAgent(BaseTetrisAgent):
                 except GameOver:
                     self.games += 1
                     break
-            self.logger.log(logging.DEBUG, f'average loss={self.avg_loss}')
\ No newline at end of file
+            self.logger.log(logging.DEBUG, f'average loss={float(self.avg_loss)}')
+
+class DeepQPrioritizedReplayAgent(DeepQExpReplayAgent):
+
+    agent_name = 'Deep Q learning with prioritized experience replay'
+
+    prioritized_replay = True
+
+class DeepQActorLearnerAgent(DeepQExpReplayAgent):
+
+    agent_name = 'Deep Q learning with parallel actor processes'
+
+    # one core for the learner, the rest for actors
+    actors = max((os.cpu_count() or 2) - 1, 1)
@@ -1,9 +1,15 @@
+import json
 from typing import Callable
 
 from base_agent import BaseTetrisAgent
-from state import TetrisGameState
+from state import TetrisGameState, MoveContext, legal_moves
+from board import TetrisBoard, GameOver
+from tetrominoes import Tetromino, OrientedTetromino
+from transposition import TranspositionTable
+import features2
 from features2 import (eroded_piece_cells, col_transitions, row_transitions,
-    holes, landing_height, cumulative_wells)
+    holes, landing_height, cumulative_wells, feature_vector, context_features,
+    board_features, DELLACHERIE_FEATURES)
 
 class DellacherieAgent(BaseTetrisAgent):
 
@@ -18,11 +24,151 @@ class DellacherieAgent(BaseTetrisAgent):
         holes: -4.0
     }
 
+    # shared by every instance, so agents with different weights still reuse
+    # each other's feature vectors
+    transposition_table = TranspositionTable()
+
+    # what afterstate_score gives moves that end the game
+    gameover_score = float('-inf')
+
     def __init__(self, logger):
         self.logger = logger
 
+    def save_weights(self, filename):
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump({'weights': {feature.__name__: w for feature, w in self.weights.items()}}, f, indent=2)
+
+    def load_weights(self, filename):
+        '''
+        load weights saved by save_weights or a cem.py checkpoint. they're
+        stored as {features2 function name: weight}
+        '''
+        with open(filename, encoding='utf-8') as f:
+            weights = json.load(f)['weights']
+        self.weights = {getattr(features2, name): w for name, w in weights.items()}
+
+    def weights_id(self):
+        # the feature functions themselves, not their names: the table is shared
+        # by every agent, and features from different modules can share a name
+        return tuple(self.weights.items())
+
+    def move_features(self, state : TetrisGameState, features) -> 'dict[tuple[int, int], list[float]]':
+        '''
+        feature vectors of every move, looked up by position in the transposition
+        table (so the features can only depend on the board and current tetromino)
+        '''
+        key = (state.board.zobrist_hash(), state.tet.letter, tuple(features))
+        move_features = self.transposition_table.get(key)
+        if move_features is None:
+            move_features = {(orient, col): feature_vector(state, orient, col, features)
+                for orient, col in state.get_moves()}
+            self.transposition_table.put(key, move_features)
+        return move_features
+
+    def move_scores(self, state : TetrisGameState) -> 'tuple[tuple[int, int], dict[tuple[int, int], float]]':
+        '''
+        returns (best move, {move: score}), looked up by position in the transposition table
+        '''
+        key = (state.board.zobrist_hash(), state.tet.letter, self.weights_id())
+        entry = self.transposition_table.get(key)
+        if entry is None:
+            features = list(self.weights)
+            weights = list(self.weights.values())
+            scores = {move: sum(w*v for w, v in zip(weights, values))
+                for move, values in self.move_features(state, features).items()}
+            entry = max(scores, key=lambda m: scores[m]), scores
+            self.transposition_table.put(key, entry)
+        return entry
+
+    def fused_weights(self) -> 'tuple[float]':
+        '''
+        the weights in DELLACHERIE_FEATURES order, for scoring afterstates with
+        features2.context_features
+        '''
+        unknown = [f.__name__ for f in self.weights if f not in DELLACHERIE_FEATURES]
+        if unknown:
+            raise ValueError(f'lookahead only works with DELLACHERIE_FEATURES, not {unknown}')
+        return tuple(self.weights.get(f, 0) for f in DELLACHERIE_FEATURES)
+
+    def afterstate_score(self, context : MoveContext, ot : OrientedTetromino, weights) -> float:
+        if context.gameover:
+            return self.gameover_score
+        return sum(w*v for w, v in zip(weights, context_features(context, ot)))
+
+    def best_followup(self, board : TetrisBoard, tet : Tetromino, weights) -> float:
+        '''
+        score of the best placement of tet on board, looked up by position in
+        the transposition table
+        '''
+        key = (board.zobrist_hash(), tet.letter, self.weights_id(), 'followup')
+        best = self.transposition_table.get(key)
+        if best is None:
+            best = max(self.placement_score(board, tet, orient, col, weights) for orient, col in legal_moves(tet))
+            self.transposition_table.put(key, best)
+        return best
+
+    def placement_score(self, board : TetrisBoard, tet : Tetromino, orient, col, weights) -> float:
+        '''
+        afterstate_score of dropping tet on board, placed and taken back on the
+        board itself rather than a copy, for afterstates that are only scored
+        '''
+        try:
+            record = board.apply(tet, orient, col)
+        except GameOver:
+            return self.gameover_score
+        try:
+            yi, cleared = record[:2]
+            return sum(w*v for w, v in zip(weights, board_features(board, tet[orient], yi, cleared)))
+        finally:
+            # whatever happens, the caller's board is left as it was
+            board.undo(record)
+
+    def get_best_move(self, state: TetrisGameState) -> 'tuple[int, int]':
+        best, _ = self.move_scores(state)
+        return best
+
+    def monitor(self):
+        return self.transposition_table.monitor()
+
+class DellacherieLookaheadAgent(DellacherieAgent):
+    '''
+    two-ply: moves are also scored by the best placement of next_tet that
+    follows them. only the lookahead_width best moves by their own score are
+    looked at that far
+    '''
+
+    agent_name = 'Dellacherie\'s agent with one piece lookahead'
+
+    lookahead_width = 6
+
+    def candidate_moves(self, state : TetrisGameState) -> 'list[tuple[int, int]]':
+        '''
+        the lookahead_width best moves by move_scores
+        '''
+        _, first = self.move_scores(state)
+        return sorted(first, key=lambda m: first[m], reverse=True)[:self.lookahead_width]
+
+    def move_value(self, state : TetrisGameState, orient, col) -> float:
+        '''
+        the move's score plus that of the best placement of next_tet after it.
+        moves that end the game, or leave no room for next_tet, get
+        gameover_score
+        '''
+        context = state.move_context(orient, col)
+        if context.gameover:
+            return self.gameover_score
+        # same sum as move_scores, so a move scores exactly the same either way
+        score = sum(w*v for w, v in zip(self.weights.values(), feature_vector(state, orient, col, list(self.weights))))
+        return score + self.best_followup(context.board, state.next_tet, self.fused_weights())
+
+    def lookahead_scores(self, state : TetrisGameState) -> 'tuple[tuple[int, int], dict[tuple[int, int], float]]':
+        '''
+        returns (best move, {move: move_value}) for the candidate moves
+        '''
+        candidates = self.candidate_moves(state)
+        scores = {move: self.move_value(state, *move) for move in candidates}
+        return max(candidates, key=lambda m: scores[m]), scores
+
     def get_best_move(self, state: TetrisGameState) -> 'tuple[int, int]':
-        moves = list(state.get_moves())
-        move_scores = {(orient, col): sum(w*f(state, orient, col) for f, w in self.weights.items())
-            for orient, col in moves}
-        return max(moves, key=lambda m: move_scores[m])
+        best, _ = self.lookahead_scores(state)
+        return best
@@ -79,8 +79,8 @@ class RecordDemonstrationsRunner(Runner):
         #pylint:disable=protected-access
         board, tet, nt, orient, col = demo
         boardints = []
-        for row in board._board:
-            bits = ''.join(['1' if c else '0' for c in row])
+        for row in board._rows:
+            bits = ''.join(['1' if row >> x & 1 else '0' for x in range(WIDTH)])
             n = int(bits, base=2)
             boardints.append(str(n))
         return f'{"/".join(boardints)}|{tet.letter}|{nt.letter}:{orient},{col}\n'
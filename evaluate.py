@@ -0,0 +1,214 @@
+'''
+headless agent evaluation: plays seeded games of an agent across a process pool
+and reports lines/score statistics along with how fast the agent plays.
+
+    python3 evaluate.py dellacherie --games 20 --workers 4
+
+games are reported as they finish, so one very long game doesn't hold up the rest.
+--compare plays the same games with a second agent and reports the difference
+in lines cleared against the difference in per-move latency:
+
+    python3 evaluate.py dellacherie_lookahead --compare dellacherie --max-pieces 2000
+'''
+import argparse
+import importlib
+import logging
+import statistics
+from multiprocessing import Pool
+from timeit import default_timer as timer
+
+from board import GameOver
+from state import TetrisGameState
+
+# same agents as AIRunner.installed_agents, imported only when asked for so that
+# agents which don't need tensorflow can be evaluated without it
+AGENTS = {
+    'q474': ('q474', 'TetrisQLearningAgent'),
+    'dellacherie': ('dellacherie', 'DellacherieAgent'),
+    'dellacherie_lookahead': ('dellacherie', 'DellacherieLookaheadAgent'),
+    'expectimax': ('expectimax', 'ExpectimaxAgent'),
+    'anytime': ('anytime', 'AnytimeAgent'),
+    'beam': ('beam', 'BeamSearchAgent'),
+    'deepq': ('deepq', 'DeepQAgent'),
+    'deepq_exp': ('deepq_exp', 'DeepQExpReplayAgent'),
+    'deepq_prioritized': ('deepq_exp', 'DeepQPrioritizedReplayAgent'),
+    'deepq_numpy': ('numpy_q', 'NumpyQAgent'),
+}
+
+logger = logging.getLogger('evaluate')
+logger.addHandler(logging.NullHandler())
+
+def load_agent(name, weights=None, time_budget=None, move_workers=None):
+    module, cls = AGENTS[name]
+    agent = getattr(importlib.import_module(module), cls)(logger)
+    if weights is not None:
+        agent.load_weights(weights)
+    if time_budget is not None:
+        if not hasattr(agent, 'time_budget'):
+            raise ValueError(f'agent {name} has no time budget to set')
+        agent.time_budget = time_budget
+    if move_workers is not None:
+        from parallel import ParallelAgent
+        agent = ParallelAgent(agent, move_workers)
+    return agent
+
+# each worker process builds its agent once and reuses it for every game it plays
+_agents = {}
+
+def play_game(task):
+    '''
+    play one game given (agent name, seed, piece cap, load_agent arguments)
+    and return its results as a dict
+    '''
+    name, seed, max_pieces, agent_args = task
+    if (name, agent_args) not in _agents:
+        _agents[name, agent_args] = load_agent(name, *agent_args)
+    agent = _agents[name, agent_args]
+    # agents that search against a time budget report how deep they got
+    searches = hasattr(agent, 'search_stats')
+    if searches:
+        agent.reset_search_stats()
+
+    state = TetrisGameState(seed=seed)
+    lines = pieces = 0
+    think_time = max_think_time = 0
+    start = timer()
+    while max_pieces is None or pieces < max_pieces:
+        move_start = timer()
+        orient, col = agent.get_best_move(state)
+        move_time = timer() - move_start
+        think_time += move_time
+        max_think_time = max(max_think_time, move_time)
+        try:
+            _, reward, cleared = state.make_move(orient, col)
+        except GameOver:
+            break
+        pieces += 1
+        state.score += reward
+        lines += len(cleared)
+    result = {
+        'seed': seed,
+        'score': state.score,
+        'lines': lines,
+        'pieces': pieces,
+        'capped': max_pieces is not None and pieces >= max_pieces,
+        'seconds': timer() - start,
+        'think_time': think_time,
+        'max_think_time': max_think_time,
+    }
+    if searches:
+        result['search'] = agent.search_stats()
+    return result
+
+def run_games(name, games, seed=0, workers=1, max_pieces=None, weights=None, time_budget=None,
+        move_workers=None):
+    '''
+    yield the result of each game as soon as it's finished. game i is played with seed + i
+    '''
+    if workers > 1 and move_workers is not None:
+        # pool workers can't start pools of their own
+        raise ValueError('can\'t spread moves across processes when games are played in parallel')
+    agent_args = (weights, time_budget, move_workers)
+    tasks = [(name, seed + i, max_pieces, agent_args) for i in range(games)]
+    if workers == 1:
+        yield from map(play_game, tasks)
+        return
+    with Pool(workers) as pool:
+        yield from pool.imap_unordered(play_game, tasks)
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+def summarize(results, wall_time):
+    '''
+    report on a finished batch of games as a list of lines
+    '''
+    out = []
+    for key in ('lines', 'score'):
+        values = [r[key] for r in results]
+        out.append(f'{key}: mean {statistics.mean(values):.1f}, median {statistics.median(values)}, '
+            f'p10 {percentile(values, 10)}, p90 {percentile(values, 90)}, '
+            f'min {min(values)}, max {max(values)}')
+    pieces = sum(r['pieces'] for r in results)
+    think_time = sum(r['think_time'] for r in results)
+    capped = sum(r['capped'] for r in results)
+    out.append(f'pieces: {pieces} in {wall_time:.1f}s ({pieces / wall_time:.0f} pieces/s overall)')
+    if pieces:
+        out.append(f'move latency: mean {think_time / pieces * 1000:.3f} ms, '
+            f'max {max(r["max_think_time"] for r in results) * 1000:.3f} ms')
+    searches = [r['search'] for r in results if 'search' in r]
+    if searches:
+        moves = sum(s['moves'] for s in searches)
+        depth = sum(s['mean_depth'] * s['moves'] for s in searches) / moves if moves else 0
+        nodes = sum(s['nodes'] for s in searches)
+        out.append(f'search depth: mean {depth:.2f}, max {max(s["max_depth"] for s in searches)}, '
+            f'{nodes / think_time if think_time else 0:.0f} nodes/s')
+    if capped:
+        out.append(f'{capped} game(s) stopped at the piece cap')
+    return out
+
+def mean_latency(results):
+    pieces = sum(r['pieces'] for r in results)
+    return sum(r['think_time'] for r in results) / pieces if pieces else 0
+
+def compare(results, baseline):
+    '''
+    lines gained against latency added over a baseline agent's results on the same seeds
+    '''
+    lines = statistics.mean(r['lines'] for r in results)
+    baseline_lines = statistics.mean(r['lines'] for r in baseline)
+    latency = mean_latency(results)
+    baseline_latency = mean_latency(baseline)
+    out = [f'lines: {lines:.1f} vs {baseline_lines:.1f} ({lines - baseline_lines:+.1f}, '
+        f'{lines / baseline_lines - 1 if baseline_lines else 0:+.1%})']
+    out.append(f'move latency: {latency * 1000:.3f} ms vs {baseline_latency * 1000:.3f} ms '
+        f'({(latency - baseline_latency) * 1000:+.3f} ms, '
+        f'{latency / baseline_latency if baseline_latency else 0:.1f}x)')
+    return out
+
+def evaluate(name, games, seed=0, workers=1, max_pieces=None, weights=None, verbose=True, time_budget=None,
+        move_workers=None):
+    results = []
+    start = timer()
+    for r in run_games(name, games, seed, workers, max_pieces, weights, time_budget, move_workers):
+        results.append(r)
+        if verbose:
+            print(f'[{len(results)}/{games}] seed {r["seed"]}: {r["lines"]} lines, score {r["score"]}, '
+                f'{r["pieces"]} pieces in {r["seconds"]:.1f}s', flush=True)
+    return results, timer() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('agent', choices=AGENTS)
+    parser.add_argument('--games', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0, help='game i is played with seed + i')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--max-pieces', type=int, default=None, help='stop games after this many pieces')
+    parser.add_argument('--weights', default=None, help='checkpoint to load into the agent')
+    parser.add_argument('--time-budget', type=float, default=None,
+        help='seconds per move, for agents that search against a deadline')
+    parser.add_argument('--move-workers', type=int, default=None,
+        help='score each move\'s candidates across this many processes (needs --workers 1)')
+    parser.add_argument('--compare', default=None, choices=AGENTS,
+        help='also play the games with this agent and compare the two')
+    args = parser.parse_args()
+
+    results, wall_time = evaluate(args.agent, args.games, args.seed, args.workers,
+        args.max_pieces, args.weights, time_budget=args.time_budget, move_workers=args.move_workers)
+    print(f'=== {args.agent}, {args.games} games ===')
+    for line in summarize(results, wall_time):
+        print(line)
+
+    if args.compare is not None:
+        baseline, wall_time = evaluate(args.compare, args.games, args.seed, args.workers,
+            args.max_pieces)
+        print(f'=== {args.compare}, {args.games} games ===')
+        for line in summarize(baseline, wall_time):
+            print(line)
+        print(f'=== {args.agent} against {args.compare} ===')
+        for line in compare(results, baseline):
+            print(line)
+
+if __name__ == '__main__':
+    main()
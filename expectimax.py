@@ -0,0 +1,135 @@
+'''
+expectimax search over the pieces still to come. the current tetromino and
+next_tet are known; after them the 7-bag means the next piece can only be one of
+the pieces left in tet_iq (or any piece, once the bag is empty), so chance nodes
+only average over those. leaves are scored with DellacherieAgent's weights
+'''
+import random
+
+from state import TetrisGameState, MoveContext, legal_moves, afterstate
+from board import TetrisBoard
+from tetrominoes import Tetromino, tetlist
+from transposition import TranspositionTable
+from dellacherie import DellacherieAgent
+
+FULL_BAG = frozenset(range(len(tetlist)))
+
+class ExpectimaxAgent(DellacherieAgent):
+
+    agent_name = 'expectimax over the pieces left in the bag'
+
+    # pieces placed per line searched, counting the current one and next_tet
+    depth = 3
+    # moves followed further at each max node, best first by their own score
+    width = 4
+    # chance nodes average over at most this many of the possible pieces, picked
+    # at random. None averages over all of them
+    samples = None
+    # finite, so that a chance node where some pieces lose is worse than one
+    # where none do, rather than every such node being -inf
+    gameover_score = -1000.0
+
+    # chance nodes fill the table much faster than the one piece agent does
+    transposition_table = TranspositionTable(size=1 << 16)
+
+    def __init__(self, logger):
+        super().__init__(logger)
+        self.nodes = 0
+        self.rng = random.Random(0)
+
+    def move_values(self, board : TetrisBoard, tet : Tetromino, weights) -> 'list[tuple[float, MoveContext]]':
+        '''
+        (score, afterstate) of every move of tet on board, best first
+        '''
+        values = []
+        for orient, col in legal_moves(tet):
+            context = afterstate(board, tet, orient, col)
+            values.append((self.afterstate_score(context, tet[orient], weights), context))
+        self.nodes += len(values)
+        values.sort(key=lambda v: v[0], reverse=True)
+        return values
+
+    def max_value(self, board : TetrisBoard, tet : Tetromino, bag, depth, weights) -> float:
+        '''
+        value of the best move of tet on board, with depth pieces left to place
+        counting tet. bag is what's left in the 7-bag after tet was drawn
+        '''
+        if depth == 1:
+            # leaves are only scored, so there's no need to keep their boards
+            moves = list(legal_moves(tet))
+            self.nodes += len(moves)
+            return max(self.placement_score(board, tet, orient, col, weights) for orient, col in moves)
+        values = self.move_values(board, tet, weights)
+        return max(score if context.gameover else score + self.chance_value(context.board, bag, depth - 1, weights)
+            for score, context in values[:self.width])
+
+    def chance_value(self, board : TetrisBoard, bag, depth, weights) -> float:
+        '''
+        value of board averaged over the pieces that can be drawn from bag,
+        looked up by position in the transposition table
+        '''
+        key = (board.zobrist_hash(), bag, depth, self.width, self.samples, self.weights_id(), 'chance')
+        value = self.transposition_table.get(key)
+        if value is None:
+            pieces = bag or FULL_BAG
+            drawn = self.chance_pieces(pieces)
+            value = sum(self.max_value(board, tetlist[i], pieces - {i}, depth, weights)
+                for i in drawn) / len(drawn)
+            self.transposition_table.put(key, value)
+        return value
+
+    def chance_pieces(self, pieces) -> 'list[int]':
+        '''
+        which of the possible pieces a chance node averages over
+        '''
+        if self.samples is None or len(pieces) <= self.samples:
+            return list(pieces)
+        return self.rng.sample(sorted(pieces), self.samples)
+
+    def first_scores(self, state : TetrisGameState, weights) -> 'dict[tuple[int, int], float]':
+        return {(orient, col): self.afterstate_score(state.move_context(orient, col), state.tet[orient], weights)
+            for orient, col in state.get_moves()}
+
+    def candidate_moves(self, state : TetrisGameState, depth=None) -> 'list[tuple[int, int]]':
+        '''
+        the width best moves by their own score, or every move for a 1 piece search
+        '''
+        if depth is None:
+            depth = self.depth
+        first = self.first_scores(state, self.fused_weights())
+        self.nodes += len(first)
+        candidates = sorted(first, key=lambda m: first[m], reverse=True)
+        if depth > 1:
+            candidates = candidates[:self.width]
+        return candidates
+
+    def move_value(self, state : TetrisGameState, orient, col, depth=None) -> float:
+        '''
+        the move's own score plus the value of the position it leaves,
+        searching depth pieces ahead (self.depth by default)
+        '''
+        if depth is None:
+            depth = self.depth
+        weights = self.fused_weights()
+        context = state.move_context(orient, col)
+        value = self.afterstate_score(context, state.tet[orient], weights)
+        if not context.gameover and depth > 1:
+            value += self.max_value(context.board, state.next_tet, frozenset(state.tet_iq), depth - 1, weights)
+        return value
+
+    def expectimax_scores(self, state : TetrisGameState,
+            depth=None) -> 'tuple[tuple[int, int], dict[tuple[int, int], float]]':
+        '''
+        returns (best move, {move: move_value}) for the candidate moves
+        '''
+        candidates = self.candidate_moves(state, depth)
+        scores = {move: self.move_value(state, *move, depth) for move in candidates}
+        return max(candidates, key=lambda m: scores[m]), scores
+
+    def get_best_move(self, state: TetrisGameState) -> 'tuple[int, int]':
+        best, _ = self.expectimax_scores(state)
+        return best
+
+    def monitor(self):
+        out = f'afterstates evaluated = {self.nodes}\n'
+        return out + self.transposition_table.monitor()
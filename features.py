@@ -24,8 +24,8 @@ def row_shape(state: TetrisGameState, orient, col, context):
     for x in range(WIDTH):
         if state.board[x, yi]:
             shape[x] = 1
-    for dx in range(ot.width):
-        if ot[dx, 0]:
+    for dx, dy in ot.cells:
+        if dy == 0:
             shape[col + dx] = 1
     return tuple(shape)
 
@@ -36,9 +36,7 @@ def row_count(state: TetrisGameState, orient, col, context):
     for x in range(WIDTH):
         if state.board[x, yi]:
             count += 1
-    for dx in range(ot.width):
-        if ot[dx, 0]:
-            count += 1
+    count += sum(1 for _, dy in ot.cells if dy == 0)
     return (count/WIDTH)**4
 
 def target_roughness(state: TetrisGameState, orient, col, context):
@@ -72,9 +70,7 @@ def hspan_count(state: TetrisGameState, orient, col, context):
         for x in range(WIDTH):
             if state.board[x, yi + dy]:
                 count += 1
-        for dx in range(ot.width):
-            if ot[dx, dy]:
-                count += 1
+    count += len(ot.cells)
     return (count/(ot.height*WIDTH))**12
 
 def cur_col_height(state: TetrisGameState, orient, col, context):
@@ -234,9 +230,7 @@ def contact(state: TetrisGameState, orient, col, context):
     touching = 0
     total = 0
     yi = context['yi']
-    for dx, dy in ot.offsets():
-        if not ot[dx, dy]:
-            continue
+    for dx, dy in ot.cells:
         for adx, ady in adjacent(dx, dy):
             if ot[adx, ady]:
                 continue
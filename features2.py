@@ -6,8 +6,10 @@ The signature of all features is f(state, orient, col) -> number
 
 from typing import Callable
 
-from state import TetrisGameState
-from board import TetrisBoard, HEIGHT, WIDTH
+from state import TetrisGameState, MoveContext
+from board import TetrisBoard, WIDTH
+from tetrominoes import OrientedTetromino
+import rowtables
 
 # def next_board_feature(f : 'Callable[[TetrisBoard], float]', default=1.0):
 #     '''
@@ -15,10 +17,10 @@ from board import TetrisBoard, HEIGHT, WIDTH
 #     of the form `board -> float` into the desired form of `state -> orient -> col -> float`
 #     '''
 #     def g(state : TetrisGameState, orient, col):
-#         gameover, dummy, _, _ = state.generate_move_context(orient, col)
-#         if gameover:
+#         context = state.move_context(orient, col)
+#         if context.gameover:
 #             return default
-#         return f(dummy)
+#         return f(context.board)
 #     return g
 
 def holes(state : TetrisGameState, orient, col):
@@ -27,17 +29,18 @@ def holes(state : TetrisGameState, orient, col):
     '''
     
     #this preamble is standard for move-agnostic features
-    gameover, board, _, _ = state.generate_move_context(orient, col)
-    if gameover:
+    context = state.move_context(orient, col)
+    if context.gameover:
         return 0
+    board = context.board
 
+    counts = rowtables.fill_counts()
     h = 0
-    for x, y in board.coords():
-        if not board[x, y]:
-            for ty in range(y + 1, HEIGHT):
-                if board[x, ty]:
-                    h += 1
-                    break
+    covered = 0
+    for row in reversed(board.row_masks()):
+        # empty cells in columns with a block somewhere above
+        h += counts[covered & ~row]
+        covered |= row
     return h/200
 
 def landing_height(state : TetrisGameState, orient, col):
@@ -45,26 +48,26 @@ def landing_height(state : TetrisGameState, orient, col):
     height where placed piece lands (0 is the bottom)
     '''
 
-    gameover, dummy, yi, cleared = state.generate_move_context(orient, col)
-    if gameover:
+    context = state.move_context(orient, col)
+    if context.gameover:
         return 1
-    yi = state.board.place_tetromino(state.tet, orient, col, dry_run=True)
-    return yi
+    return context.yi
 
 def eroded_piece_cells(state : TetrisGameState, orient, col):
     '''
     from Dellacherie; <lines cleared> * <blocks in placed tetromino cleared>
     '''
-    gameover, dummy, yi, cleared = state.generate_move_context(orient, col)
-    if gameover:
+    context = state.move_context(orient, col)
+    if context.gameover:
         return 0
-    relative_cleared = [i - yi for i in cleared]
-    ot = state.tet[orient]
+    return _eroded(state.tet[orient], context.yi, context.cleared)
+
+def _eroded(ot : OrientedTetromino, yi, cleared):
+    counts = rowtables.fill_counts()
     cleared_bricks = 0
-    for i in relative_cleared:
-        for dx in range(ot.width):
-            if ot[dx, i]:
-                cleared_bricks += 1
+    for i in cleared:
+        if 0 <= i - yi < len(ot.row_masks):
+            cleared_bricks += counts[ot.row_masks[i - yi]]
     return cleared_bricks*len(cleared)
 
 def col_transitions(state : TetrisGameState, orient, col):
@@ -72,34 +75,27 @@ def col_transitions(state : TetrisGameState, orient, col):
     number of vertical cell pairs which contain both an empty space and a block
     '''
 
-    gameover, board, _, _ = state.generate_move_context(orient, col)
-    if gameover:
+    context = state.move_context(orient, col)
+    if context.gameover:
         return 0
+    board = context.board
 
-    transitions = 0
-    for x in range(WIDTH):
-        for y in range(HEIGHT-1):
-            if (board[x, y] and not board[x, y+1]
-                    or board[x, y+1] and not board[x, y]):
-                transitions += 1
-    return transitions
+    counts = rowtables.fill_counts()
+    rows = board.row_masks()
+    return sum(counts[below ^ above] for below, above in zip(rows, rows[1:]))
 
 def row_transitions(state : TetrisGameState, orient, col):
     '''
     number of horizontal cell pairs which contain both an empty space and a block
     '''
 
-    gameover, board, _, _ = state.generate_move_context(orient, col)
-    if gameover:
+    context = state.move_context(orient, col)
+    if context.gameover:
         return 0
+    board = context.board
 
-    transitions = 0
-    for x in range(WIDTH-1):
-        for y in range(HEIGHT):
-            if (board[x, y] and not board[x+1, y]
-                    or board[x+1, y] and not board[x, y]):
-                transitions += 1
-    return transitions
+    transitions = rowtables.row_transitions()
+    return sum(transitions[row] for row in board.row_masks())
     
 def cumulative_wells(state : TetrisGameState, orient, col):
     '''
@@ -108,24 +104,109 @@ def cumulative_wells(state : TetrisGameState, orient, col):
     well defined as vertical sequence of empty cells with blocks left and right 
     '''
 
-    gameover, board, _, _ = state.generate_move_context(orient, col)
-    if gameover:
+    context = state.move_context(orient, col)
+    if context.gameover:
         return 0
+    board = context.board
 
+    well_cells = rowtables.well_cells()
     total = 0
-    for x in range(WIDTH):
-        y = HEIGHT-1
-        cur_well_depth = 0
-        while y >= 0:
-            if (not board[x, y] 
-                    and (x == 0 or board[x-1, y])
-                    and (x == WIDTH-1 or board[x+1, y])):
-                cur_well_depth += 1
-            elif cur_well_depth:
-                total += cur_well_depth * (cur_well_depth + 1) / 2 # sum (1..depth)
-                cur_well_depth = 0
-            y -= 1
-        total += cur_well_depth * (cur_well_depth + 1) / 2
-
-    return total
+    # depth of the well currently running down each column
+    depths = [0] * WIDTH
+    in_well = 0
+    for row in reversed(board.row_masks()):
+        in_well, total = _extend_wells(well_cells[row], in_well, depths, total)
+    return float(total)
+
+def _extend_wells(well, in_well, depths, total):
+    '''
+    carry the running well depths down one row with well cells `well`, where
+    in_well is the well mask of the row above. adding the running depth at each
+    well cell sums to 1 + 2 + ... + depth by the time a well ends
+    '''
+    ended = in_well & ~well
+    while ended:
+        depths[(ended & -ended).bit_length() - 1] = 0
+        ended &= ended - 1
+    in_well = well
+    while well:
+        x = (well & -well).bit_length() - 1
+        depths[x] += 1
+        total += depths[x]
+        well &= well - 1
+    return in_well, total
+
+
+# feature order of the fused kernel below (same as DeepQAgent.features)
+DELLACHERIE_FEATURES = (
+    eroded_piece_cells,
+    col_transitions,
+    row_transitions,
+    holes,
+    landing_height,
+    cumulative_wells
+)
+_FUSED_INDEX = {f: i for i, f in enumerate(DELLACHERIE_FEATURES)}
+# what each feature above returns for a move that ends the game
+GAMEOVER_FEATURES = (0, 0, 0, 0, 1, 0)
+
+def board_features(board : TetrisBoard, ot : OrientedTetromino, yi, cleared):
+    '''
+    all of DELLACHERIE_FEATURES for ot landing on row yi, given the board it
+    leaves behind, in a single top to bottom pass over the row bitmasks.
+    gives exactly what the per-feature functions above give
+    '''
+    counts = rowtables.fill_counts()
+    transitions = rowtables.row_transitions()
+    well_cells = rowtables.well_cells()
+
+    col_trans = row_trans = n_holes = wells = 0
+    above = None
+    covered = 0
+    depths = [0] * WIDTH
+    in_well = 0
+    for row in reversed(board.row_masks()):
+        row_trans += transitions[row]
+        if above is not None:
+            col_trans += counts[row ^ above]
+            covered |= above
+        n_holes += counts[covered & ~row]
+        in_well, wells = _extend_wells(well_cells[row], in_well, depths, wells)
+        above = row
+
+    return _eroded(ot, yi, cleared), col_trans, row_trans, n_holes/200, yi, float(wells)
+
+def dellacherie_features(state : TetrisGameState, orient, col):
+    '''
+    values of DELLACHERIE_FEATURES for a move, computed once per move and kept
+    on its MoveContext
+    '''
+    return context_features(state.move_context(orient, col), state.tet[orient])
+
+def context_features(context : MoveContext, ot : OrientedTetromino):
+    '''
+    values of DELLACHERIE_FEATURES for ot making the move described by context,
+    kept on the context
+    '''
+    if context.gameover:
+        return GAMEOVER_FEATURES
+    if context.features is None:
+        context.features = board_features(context.board, ot, context.yi, context.cleared)
+    return context.features
 
+def feature_vector(state : TetrisGameState, orient, col, features):
+    '''
+    [f(state, orient, col) for f in features], except that features from
+    DELLACHERIE_FEATURES are all read off one dellacherie_features call
+    '''
+    fused = None
+    out = []
+    for f in features:
+        i = _FUSED_INDEX.get(f)
+        if i is None:
+            out.append(f(state, orient, col))
+            continue
+        if fused is None:
+            fused = dellacherie_features(state, orient, col)
+        out.append(fused[i])
+    return out
@@ -22,7 +22,8 @@ block_colors = {
     's': Colors.green,
     'j': Colors.blue,
     't': Colors.magenta,
-    'i': Colors.cyan
+    'i': Colors.cyan,
+    '#': Colors.white
 }
 
 color_attrs = {}
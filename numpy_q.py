@@ -0,0 +1,111 @@
+'''
+numpy inference for the deep q agents' small mlp (6 -> 16 -> 16 -> 1). for a
+network this size a keras call costs far more than the arithmetic, so playing
+goes through plain matrix products instead. models are exported to .npz along
+with the names of their features, and NumpyQAgent plays them without importing
+tensorflow:
+
+    python3 numpy_q.py deepq_exp DeepQExpReplayAgent/checkpoint deepq_exp.npz
+    python3 evaluate.py deepq_numpy --weights deepq_exp.npz
+'''
+import argparse
+
+import numpy as np
+
+from base_agent import BaseTetrisAgent
+from board import GameOver
+from state import TetrisGameState
+from batch_features import feature_matrix
+import features2
+
+class NumpyQModel:
+    '''
+    relu dense layers ending in one linear unit, with params laid out like
+    keras' model.get_weights(): [W1, b1, W2, b2, ..., Wout, bout]
+    '''
+
+    def __init__(self, params):
+        self.params = [np.asarray(p, dtype=np.float32) for p in params]
+        self.hidden = list(zip(self.params[:-2:2], self.params[1:-2:2]))
+        # the output layer as a vector, so it's a matrix-vector product
+        self.w_out = self.params[-2][:, 0]
+        self.b_out = self.params[-1][0]
+
+    def __call__(self, X):
+        '''
+        q values of the rows of X
+        '''
+        h = np.asarray(X, dtype=np.float32)
+        for W, b in self.hidden:
+            h = np.maximum(h @ W + b, 0)
+        return h @ self.w_out + self.b_out
+
+def export_npz(model, features, filename):
+    '''
+    save a keras model's weights and the features it takes to filename
+    '''
+    params = model.get_weights()
+    np.savez(filename, features=np.array([f.__name__ for f in features]), n_params=len(params),
+        **{f'param{i}': p for i, p in enumerate(params)})
+
+def load_npz(filename) -> 'tuple[NumpyQModel, list]':
+    '''
+    returns (model, features) saved by export_npz
+    '''
+    with np.load(filename) as data:
+        params = [data[f'param{i}'] for i in range(int(data['n_params']))]
+        features = [getattr(features2, name) for name in list(data['features'])]
+    return NumpyQModel(params), features
+
+class NumpyQAgent(BaseTetrisAgent):
+    '''
+    plays (but can't train) a deep q model exported with export_npz
+    '''
+
+    agent_name = 'Deep Q model exported to numpy (play only)'
+
+    def __init__(self, logger):
+        self.logger = logger
+        self.model = None
+        self.features = None
+
+    def load_weights(self, filename):
+        self.model, self.features = load_npz(filename)
+
+    def get_best_move(self, state : TetrisGameState) -> 'tuple[int, int]':
+        if self.model is None:
+            raise ValueError('no model loaded, see load_weights')
+        moves, X = feature_matrix(state, self.features)
+        return moves[int(np.argmax(self.model(X)))]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('agent', choices=['deepq', 'deepq_exp', 'deepq_prioritized'])
+    parser.add_argument('checkpoint', help='weights saved by the agent')
+    parser.add_argument('output', help='.npz file to write')
+    parser.add_argument('--tolerance', type=float, default=1e-5)
+    args = parser.parse_args()
+
+    from evaluate import load_agent #pylint: disable=import-outside-toplevel
+    agent = load_agent(args.agent, args.checkpoint)
+    agent.export_npz(args.output)
+    model = agent.model
+
+    # check the export against keras on real positions
+    exported, features = load_npz(args.output)
+    state = TetrisGameState(seed=0)
+    worst = 0
+    for _ in range(50):
+        moves, X = feature_matrix(state, features)
+        expected = model(X.astype(np.float32)).numpy()[:, 0]
+        worst = max(worst, float(np.max(np.abs(exported(X) - expected) / (1 + np.abs(expected)))))
+        try:
+            state.make_move(*moves[int(np.argmax(expected))])
+        except GameOver:
+            state = TetrisGameState(seed=1)
+    print(f'wrote {args.output}, largest difference from keras {worst:.2e}')
+    if worst > args.tolerance:
+        raise SystemExit(f'export differs from keras by more than {args.tolerance}')
+
+if __name__ == '__main__':
+    main()
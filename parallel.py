@@ -0,0 +1,136 @@
+'''
+spreads an agent's candidate moves across a pool of processes. every worker has
+its own copy of the agent, made when the pool starts, and the pool is kept
+running between moves. the position for each move is written to a block of
+shared memory rather than pickled, so all a worker is sent is which moves to
+score.
+
+works for agents with two methods, candidate_moves(state) giving the moves
+get_best_move chooses between, and move_value(state, orient, col), where
+get_best_move is the candidate with the highest move_value (the first one on
+ties). DellacherieLookaheadAgent, ExpectimaxAgent and q474 have them
+'''
+import atexit
+from multiprocessing import Pool
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from base_agent import BaseTetrisAgent
+from board import TetrisBoard, HEIGHT
+from state import TetrisGameState
+from tetrominoes import tetlist
+
+# layout of the shared position: a counter that goes up with every position,
+# then the row masks, the current and next tetromino, and the bag
+_ID, _ROWS, _TET, _NEXT_TET, _BAG_LEFT, _BAG = 0, 1, HEIGHT + 1, HEIGHT + 2, HEIGHT + 3, HEIGHT + 4
+_SIZE = _BAG + len(tetlist)
+
+def write_position(position : np.ndarray, state : TetrisGameState):
+    position[_ROWS:_ROWS + HEIGHT] = state.board.row_masks()
+    position[_TET] = tetlist.index(state.tet)
+    position[_NEXT_TET] = tetlist.index(state.next_tet)
+    position[_BAG_LEFT] = len(state.tet_iq)
+    position[_BAG:_BAG + len(state.tet_iq)] = state.tet_iq
+    position[_ID] += 1
+
+def read_position(position : np.ndarray) -> TetrisGameState:
+    state = TetrisGameState(seed=0)
+    state.board = TetrisBoard.from_row_masks([int(row) for row in position[_ROWS:_ROWS + HEIGHT]])
+    state.tet = tetlist[position[_TET]]
+    state.next_tet = tetlist[position[_NEXT_TET]]
+    state.tet_iq = [int(t) for t in position[_BAG:_BAG + position[_BAG_LEFT]]]
+    return state
+
+# set up in each worker by _init_worker
+_worker = {}
+
+def _init_worker(shm_name, agent):
+    shm = SharedMemory(name=shm_name)
+    _worker['shm'] = shm
+    _worker['position'] = np.ndarray(_SIZE, dtype=np.int64, buffer=shm.buf)
+    _worker['agent'] = agent
+    _worker['id'] = None
+
+def _move_values(moves):
+    '''
+    move_value of each of moves in the position currently in shared memory
+    '''
+    position = _worker['position']
+    if _worker['id'] != position[_ID]:
+        _worker['id'] = int(position[_ID])
+        _worker['state'] = read_position(position)
+    state = _worker['state']
+    return [_worker['agent'].move_value(state, orient, col) for orient, col in moves]
+
+class ParallelAgent(BaseTetrisAgent):
+    '''
+    plays like agent, with its candidate moves scored in `workers` processes.
+    the workers get a copy of agent as it is when the pool starts, so changes
+    to it afterwards (training, loading weights) only reach them after restart()
+    '''
+
+    def __init__(self, agent : BaseTetrisAgent, workers=2):
+        if not (hasattr(agent, 'candidate_moves') and hasattr(agent, 'move_value')):
+            raise ValueError(f'{type(agent).__name__} has no candidate_moves/move_value '
+                'to spread across processes')
+        if hasattr(agent, 'time_budget'):
+            # workers score moves to a fixed depth, so the budget would be ignored
+            raise ValueError(f'{type(agent).__name__} searches to a time budget, '
+                'which can\'t be split across processes')
+        if workers < 1:
+            raise ValueError(f'need at least 1 worker process, not {workers}')
+        self.agent = agent
+        self.workers = workers
+        self.agent_name = f'{agent.agent_name} ({workers} processes)'
+        self.shm = SharedMemory(create=True, size=_SIZE * np.dtype(np.int64).itemsize)
+        # the shared memory outlives the process unless it's unlinked, so this
+        # is registered before anything else can fail
+        atexit.register(self.close)
+        self.position = np.ndarray(_SIZE, dtype=np.int64, buffer=self.shm.buf)
+        self.position[:] = 0
+        self.pool = None
+        try:
+            self.restart()
+        except:
+            self.close()
+            raise
+
+    def restart(self):
+        if self.pool is not None:
+            self.pool.terminate()
+        # the pool lives as long as this object and is shut down by close()
+        self.pool = Pool(self.workers, initializer=_init_worker, #pylint: disable=consider-using-with
+            initargs=(self.shm.name, self.agent))
+
+    def close(self):
+        if self.shm is None:
+            return
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
+        del self.position
+        self.shm.close()
+        self.shm.unlink()
+        self.shm = None
+        atexit.unregister(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def get_best_move(self, state: TetrisGameState) -> 'tuple[int, int]':
+        moves = self.agent.candidate_moves(state)
+        if len(moves) == 1:
+            return moves[0]
+        write_position(self.position, state)
+        # contiguous chunks, so the values come back in the same order as moves
+        n = min(self.workers, len(moves))
+        chunks = [moves[len(moves) * i // n:len(moves) * (i + 1) // n] for i in range(n)]
+        values = [v for chunk in self.pool.map(_move_values, chunks) for v in chunk]
+        return moves[values.index(max(values))]
+
+    def monitor(self):
+        return f'{self.workers} worker processes'
@@ -122,14 +122,12 @@ class TetrisQLearningAgent(BaseTetrisAgent):
         if fmap is None:
             fmap = dict()
         context = {}
-        try:
-            context['gameover'] = False
-            board, yi, cleared = state.board.test_place_tetromino(state.tet, orient, col)
-            context['dummy'] = board
-            context['cleared'] = cleared
-            context['yi'] = yi
-        except GameOver:
-            context['gameover'] = True
+        move_context = state.move_context(orient, col)
+        context['gameover'] = move_context.gameover
+        if not move_context.gameover:
+            context['dummy'] = move_context.board
+            context['cleared'] = move_context.cleared
+            context['yi'] = move_context.yi
 
         # b = state.board.copy()
         # b.test_place_tetromino(state.tet, orient, col)
@@ -141,6 +139,12 @@ class TetrisQLearningAgent(BaseTetrisAgent):
             q += self.f_get_q_contribution(f, state, activation)
         return q
 
+    def candidate_moves(self, state):
+        return list(state.get_moves())
+
+    def move_value(self, state, orient, col):
+        return self.q_estimate(state, orient, col)
+
     def get_best_move(self, state):
         self.logger.log(logging.DEBUG, 'returning best move...')
         moves = list(state.get_moves())
@@ -154,7 +158,7 @@ class TetrisQLearningAgent(BaseTetrisAgent):
         for _ in range(iters):
             self.logger.log(logging.DEBUG, 'train step')
 
-            state = TetrisGameState()
+            state = self.training_state()
             gameover = False
             n_moves = 0
             while True:
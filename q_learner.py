@@ -0,0 +1,58 @@
+'''
+the learner step of the deep q agents, compiled into a single tensorflow graph.
+next states come as a batch padded to MAX_MOVES moves with a mask of which are
+real, so every call has the same shapes and the graph is only traced once
+'''
+import numpy as np
+import tensorflow as tf
+
+from batch_features import MAX_MOVES
+
+def no_next_moves(n_features):
+    '''
+    padded next-state batch and mask for a move that ends the game
+    '''
+    return np.zeros((MAX_MOVES, n_features), dtype=np.float32), np.zeros(MAX_MOVES, dtype=bool)
+
+def compiled_train_step(model, target_model, optimizer, discount_rate, avg_loss : tf.Variable):
+    '''
+    returns train_step(inputs, rewards, next_inputs, next_mask, weights, epoch_iters)
+    that, for a batch of B transitions with F features,
+    - scores every next move with target_model and takes the best real one
+      (0 if there are none, i.e. the game ended)
+    - takes one optimizer step on the squared error between model(inputs) and
+      rewards + discount_rate * best next q value, with each transition's error
+      scaled by its weight (importance sampling weights for prioritized replay,
+      ones otherwise)
+    - folds the mean loss into avg_loss, a running mean over epoch_iters steps
+    and returns the td error of each transition. discount_rate is fixed when
+    the step is built. inputs is (B, F), rewards and weights (B,),
+    next_inputs (B, MAX_MOVES, F), next_mask (B, MAX_MOVES) and epoch_iters a scalar
+    '''
+    n_features = model.input_shape[-1]
+
+    @tf.function(input_signature=[
+        tf.TensorSpec((None, n_features), tf.float32),
+        tf.TensorSpec((None,), tf.float32),
+        tf.TensorSpec((None, MAX_MOVES, n_features), tf.float32),
+        tf.TensorSpec((None, MAX_MOVES), tf.bool),
+        tf.TensorSpec((None,), tf.float32),
+        tf.TensorSpec((), tf.float32),
+    ])
+    def train_step(inputs, rewards, next_inputs, next_mask, weights, epoch_iters):
+        next_q = tf.reshape(target_model(tf.reshape(next_inputs, (-1, n_features))), (-1, MAX_MOVES))
+        next_q = tf.where(next_mask, next_q, tf.fill(tf.shape(next_q), -np.inf))
+        best_next_q = tf.where(tf.reduce_any(next_mask, axis=1), tf.reduce_max(next_q, axis=1), 0.)
+        q_estimates = rewards + discount_rate * best_next_q
+
+        with tf.GradientTape() as tape:
+            q_observed = tf.squeeze(model(inputs), axis=1)
+            td_errors = q_observed - q_estimates
+            loss = weights * td_errors**2
+        grads = tape.gradient(loss, model.trainable_variables)
+        optimizer.apply_gradients(zip(grads, model.trainable_variables))
+
+        avg_loss.assign(avg_loss*(epoch_iters-1)/epoch_iters + tf.reduce_mean(loss) / epoch_iters)
+        return td_errors
+
+    return train_step
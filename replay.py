@@ -0,0 +1,182 @@
+'''
+experience replay buffer for the deep q agents, kept in numpy arrays that are
+allocated once. each transition is the features of the move made, its reward,
+and the features of every move of the next state, padded to MAX_MOVES rows
+with a count of how many are real. once full, new transitions overwrite the
+oldest
+'''
+import numpy as np
+
+from batch_features import MAX_MOVES
+
+class ReplayBuffer:
+
+    def __init__(self, capacity, n_features, seed=None):
+        self.capacity = capacity
+        self.features = np.zeros((capacity, n_features), dtype=np.float32)
+        self.rewards = np.zeros(capacity, dtype=np.float32)
+        self.next_features = np.zeros((capacity, MAX_MOVES, n_features), dtype=np.float32)
+        self.next_counts = np.zeros(capacity, dtype=np.int64)
+        self.done = np.zeros(capacity, dtype=bool)
+        # where the next transition goes, and how many slots are filled
+        self.position = 0
+        self.size = 0
+        self.rng = np.random.default_rng(seed)
+
+    def __len__(self):
+        return self.size
+
+    def __repr__(self):
+        return f'ReplayBuffer({self.size}/{self.capacity})'
+
+    def add(self, inputs, reward, next_inputs=None):
+        '''
+        store a transition. next_inputs is the (moves, F) feature matrix of the
+        next state, or None if the move ended the game. returns its index
+        '''
+        i = self.position
+        self.features[i] = inputs
+        self.rewards[i] = reward
+        self._set_next(i, next_inputs)
+        self.position = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        return i
+
+    def _set_next(self, i, next_inputs):
+        if next_inputs is None:
+            self.done[i] = True
+            self.next_counts[i] = 0
+        else:
+            n = len(next_inputs)
+            self.done[i] = False
+            self.next_counts[i] = n
+            self.next_features[i, :n] = next_inputs
+            self.next_features[i, n:] = 0
+
+    def add_many(self, transitions):
+        '''
+        store a list of (inputs, reward, next_inputs or None) transitions at
+        once. returns their indices
+        '''
+        if not transitions:
+            return np.zeros(0, dtype=np.int64)
+        indices = (self.position + np.arange(len(transitions))) % self.capacity
+        self.features[indices] = [inputs for inputs, _, _ in transitions]
+        self.rewards[indices] = [reward for _, reward, _ in transitions]
+        for i, (_, _, next_inputs) in zip(indices, transitions):
+            self._set_next(i, next_inputs)
+        self.position = (self.position + len(transitions)) % self.capacity
+        self.size = min(self.size + len(transitions), self.capacity)
+        return indices
+
+    def batch(self, indices):
+        '''
+        (inputs, rewards, next_inputs, next_mask) of the transitions at indices,
+        where next_mask marks the real next moves (none for transitions that
+        ended the game)
+        '''
+        next_mask = (np.arange(MAX_MOVES) < self.next_counts[indices, None]) & ~self.done[indices, None]
+        return self.features[indices], self.rewards[indices], self.next_features[indices], next_mask
+
+    def sample_indices(self, batch_size):
+        return self.rng.integers(0, self.size, batch_size)
+
+    def sample(self, batch_size):
+        '''
+        batch() of batch_size transitions picked uniformly at random (with replacement)
+        '''
+        return self.batch(self.sample_indices(batch_size))
+
+class SumTree:
+    '''
+    binary tree in one array where every node holds the sum of its children and
+    the leaves hold the priorities, so priorities can be changed and sampled
+    from in O(log n). node 1 is the root and node i has children 2i and 2i+1
+    '''
+
+    def __init__(self, capacity):
+        self.leaves = 1
+        while self.leaves < capacity:
+            self.leaves *= 2
+        self.tree = np.zeros(2 * self.leaves, dtype=np.float64)
+
+    def total(self):
+        return self.tree[1]
+
+    def __getitem__(self, indices):
+        return self.tree[self.leaves + np.asarray(indices)]
+
+    def update(self, indices, priorities):
+        nodes = self.leaves + np.asarray(indices)
+        self.tree[nodes] = priorities
+        while nodes[0] > 1:
+            nodes = np.unique(nodes // 2)
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+
+    def find(self, values):
+        '''
+        for each value in [0, total()), the leaf whose range of the running
+        sum of priorities it falls in
+        '''
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+        while nodes[0] < self.leaves:
+            left = 2 * nodes
+            right = values >= self.tree[left]
+            values -= self.tree[left] * right
+            nodes = left + right
+        return nodes - self.leaves
+
+class PrioritizedReplayBuffer(ReplayBuffer):
+    '''
+    ReplayBuffer that samples transitions in proportion to priority**alpha,
+    where a transition's priority is its last absolute td error (new ones get
+    the highest priority seen so far, so they're sampled at least once).
+    samples come with importance sampling weights that undo the bias, annealed
+    from beta up to 1 over beta_steps samples
+    '''
+
+    def __init__(self, capacity, n_features, seed=None, alpha=0.6, beta=0.4, beta_steps=100000, epsilon=1e-3):
+        super().__init__(capacity, n_features, seed)
+        self.tree = SumTree(capacity)
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_steps = beta_steps
+        self.epsilon = epsilon
+        self.max_priority = 1.0
+        self.samples = 0
+
+    def add(self, inputs, reward, next_inputs=None):
+        i = super().add(inputs, reward, next_inputs)
+        self.tree.update([i], self.max_priority ** self.alpha)
+        return i
+
+    def add_many(self, transitions):
+        indices = super().add_many(transitions)
+        if len(indices):
+            self.tree.update(indices, self.max_priority ** self.alpha)
+        return indices
+
+    def sample_indices(self, batch_size):
+        # one value from each of batch_size equal slices of the total, which
+        # spreads the batch out more than independent draws would
+        bounds = self.tree.total() / batch_size
+        values = (np.arange(batch_size) + self.rng.random(batch_size)) * bounds
+        # rounding can walk off the end of the filled slots
+        return np.minimum(self.tree.find(values), self.size - 1)
+
+    def sample(self, batch_size):
+        '''
+        returns (indices, importance sampling weights, batch())
+        '''
+        indices = self.sample_indices(batch_size)
+        beta = min(1.0, self.beta + (1 - self.beta) * self.samples / self.beta_steps)
+        self.samples += 1
+        probs = self.tree[indices] / self.tree.total()
+        weights = (self.size * probs) ** -beta
+        return indices, (weights / weights.max()).astype(np.float32), self.batch(indices)
+
+    def update_priorities(self, indices, td_errors):
+        priorities = np.abs(td_errors) + self.epsilon
+        self.max_priority = max(self.max_priority, float(priorities.max()))
+        self.tree.update(indices, priorities ** self.alpha)
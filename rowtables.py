@@ -0,0 +1,40 @@
+'''
+lookup tables indexed by row bitmask (bit x set if column x is filled).
+a row can only be one of 2**WIDTH patterns, so row level quantities are
+worked out once for every pattern the first time a table is asked for
+'''
+from functools import lru_cache
+
+from board import WIDTH, FULL_ROW
+
+N_ROWS = 1 << WIDTH
+
+@lru_cache(maxsize=None)
+def fill_counts():
+    '''
+    number of filled blocks in each row
+    '''
+    counts = [0] * N_ROWS
+    for row in range(1, N_ROWS):
+        counts[row] = counts[row >> 1] + (row & 1)
+    return tuple(counts)
+
+@lru_cache(maxsize=None)
+def row_transitions():
+    '''
+    number of horizontally adjacent pairs in each row with one block and one
+    empty space (the walls don't count)
+    '''
+    counts = fill_counts()
+    inner = (1 << (WIDTH - 1)) - 1
+    return tuple(counts[(row ^ (row >> 1)) & inner] for row in range(N_ROWS))
+
+@lru_cache(maxsize=None)
+def well_cells():
+    '''
+    bitmask of the empty cells in each row with a block or a wall on both sides
+    '''
+    left_wall = 1
+    right_wall = 1 << (WIDTH - 1)
+    return tuple(~row & FULL_ROW & ((row << 1) | left_wall) & ((row >> 1) | right_wall)
+        for row in range(N_ROWS))
@@ -3,25 +3,142 @@ import random
 from board import GameOver, TetrisBoard, WIDTH, HEIGHT
 from tetrominoes import tetrominoes as tets, tetlist, Tetromino, OrientedTetromino
 
+class MoveContext:
+    '''
+    everything the features need to know about a move: whether it ends the game,
+    the board after the move (cleared lines removed), the landing row of the piece
+    and the indexes of the lines it cleared.
+    unpacks like the (gameover, board, yi, cleared) tuple features used to get
+
+    features holds the fused Dellacherie feature values once they're computed
+    (see features2.dellacherie_features)
+    '''
+    __slots__ = ('gameover', 'board', 'yi', 'cleared', 'features')
+
+    def __init__(self, gameover, board=None, yi=None, cleared=None):
+        self.gameover = gameover
+        self.board = board
+        self.yi = yi
+        self.cleared = cleared
+        self.features = None
+
+    def __iter__(self):
+        return iter((self.gameover, self.board, self.yi, self.cleared))
+
+    def __repr__(self):
+        return f'MoveContext(gameover={self.gameover}, yi={self.yi}, cleared={self.cleared})'
+
+class PieceSource:
+    '''
+    the tetrominoes of one game in the order they're played: the letters in
+    `sequence` first, if given, then 7-piece bags shuffled by the source's own
+    random.Random(seed). without a seed one is drawn from the global random
+    module, so random.seed() still makes games repeatable.
+
+    to_dict()/from_dict() save and restore the exact point reached in the
+    stream, so games can be resumed, and copy() forks it
+    '''
+
+    def __init__(self, seed=None, sequence=()):
+        if seed is None:
+            seed = random.getrandbits(64)
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.sequence = list(sequence)
+        self.position = 0
+        # indexes into tetlist of the pieces left in the current bag, next one last
+        self.bag = []
+
+    def __repr__(self):
+        return f'PieceSource(seed={self.seed!r})'
+
+    def draw(self) -> Tetromino:
+        if self.position < len(self.sequence):
+            self.position += 1
+            return tets[self.sequence[self.position - 1]]
+        if not self.bag:
+            self.bag = list(range(len(tetlist)))
+            self.rng.shuffle(self.bag)
+        return tetlist[self.bag.pop()]
+
+    def copy(self) -> 'PieceSource':
+        return PieceSource.from_dict(self.to_dict())
+
+    def to_dict(self):
+        version, internal, gauss_next = self.rng.getstate()
+        return {
+            'seed': self.seed,
+            'rng': [version, list(internal), gauss_next],
+            'sequence': list(self.sequence),
+            'position': self.position,
+            'bag': list(self.bag)
+        }
+
+    @classmethod
+    def from_dict(cls, d) -> 'PieceSource':
+        source = cls(d['seed'], d['sequence'])
+        version, internal, gauss_next = d['rng']
+        source.rng.setstate((version, tuple(internal), gauss_next))
+        source.position = d['position']
+        source.bag = list(d['bag'])
+        return source
+
 class TetrisGameState:
-    def __init__(self):
+    '''
+    a game of tetris. its pieces come from a PieceSource, made from `seed` and
+    `sequence` unless one is passed in as `pieces`
+    '''
+    def __init__(self, seed=None, sequence=(), pieces : PieceSource = None):
+        self._move_contexts = {}
+        self._contexts_board = None
+        self._contexts_tet = None
         self.score = 0
         self.board = TetrisBoard()
-        self.tet_iq = list(range(7))
-        random.shuffle(self.tet_iq)
-        self.next_tet = tetlist[self.tet_iq.pop()]
-        self.tet = tetlist[self.tet_iq.pop()]
+        self.pieces = pieces if pieces is not None else PieceSource(seed, sequence)
+        self.tet = self.pieces.draw()
+        self.next_tet = self.pieces.draw()
+
+    @property
+    def tet_iq(self):
+        '''
+        indexes into tetlist of the pieces left in the current bag
+        '''
+        return self.pieces.bag
+
+    @tet_iq.setter
+    def tet_iq(self, bag):
+        self.pieces.bag = bag
 
     def next_tetromino(self):
         self.tet = self.next_tet
-        try:
-            self.next_tet = tetlist[self.tet_iq.pop()]
-        except IndexError:
-            self.tet_iq = list(range(7))
-            random.shuffle(self.tet_iq)
-            self.next_tet = tetlist[self.tet_iq.pop()]
+        self.next_tet = self.pieces.draw()
+
+    def copy(self) -> 'TetrisGameState':
+        '''
+        independent copy of the game, pieces still to come included
+        '''
+        return TetrisGameState.from_dict(self.to_dict())
+
+    def to_dict(self):
+        return {
+            'board': self.board.to_dict(),
+            'tet': self.tet.letter,
+            'next_tet': self.next_tet.letter,
+            'score': self.score,
+            'pieces': self.pieces.to_dict()
+        }
+
+    @classmethod
+    def from_dict(cls, d) -> 'TetrisGameState':
+        # the current and next tetrominoes have already been drawn from the saved source
+        state = cls(seed=0, sequence=(d['tet'], d['next_tet']))
+        state.pieces = PieceSource.from_dict(d['pieces'])
+        state.board = TetrisBoard.from_dict(d['board'])
+        state.score = d['score']
+        return state
 
     def make_move(self, orient, col) -> 'tuple[TetrisBoard, int, list[int]]':
+        self.invalidate_move_contexts()
         self.board.place_tetromino(self.tet, orient, col)
         cleared = self.board.get_cleared_lines()
         old_board = self.board.copy()
@@ -33,17 +150,48 @@ class TetrisGameState:
         self.next_tetromino()
         return old_board, reward, cleared
 
-    def generate_move_context(self, orient, col) -> 'tuple[bool, TetrisBoard, int, list[int]]':
-        context = {}
+    def invalidate_move_contexts(self):
+        self._move_contexts = {}
+        self._contexts_board = self.board
+        self._contexts_tet = self.tet
+
+    def move_context(self, orient, col) -> MoveContext:
+        '''
+        simulate a move once and share the result between every feature that asks
+        for it. the cache is dropped whenever the board or current tetromino
+        changes, including when board/tet are reassigned from outside
+        '''
+        if self._contexts_board is not self.board or self._contexts_tet is not self.tet:
+            self.invalidate_move_contexts()
         try:
-            board, yi, cleared = self.board.test_place_tetromino(self.tet, orient, col)
-            return False, board, yi, cleared
-        except GameOver:
-            return True, None, None, None
+            return self._move_contexts[orient, col]
+        except KeyError:
+            pass
+        context = self._move_contexts[orient, col] = afterstate(self.board, self.tet, orient, col)
         return context
 
+    def generate_move_context(self, orient, col) -> MoveContext:
+        return self.move_context(orient, col)
+
     def get_moves(self):
-        for orient in range(self.tet.n_orientations()):
-            for col in range(WIDTH):
-                if col + self.tet[orient].width <= WIDTH:
-                    yield orient, col
\ No newline at end of file
+        return legal_moves(self.tet)
+
+def legal_moves(tet : Tetromino):
+    '''
+    every (orient, col) tet can be dropped at
+    '''
+    for orient in range(tet.n_orientations()):
+        for col in range(WIDTH):
+            if col + tet[orient].width <= WIDTH:
+                yield orient, col
+
+def afterstate(board : TetrisBoard, tet : Tetromino, orient, col) -> MoveContext:
+    '''
+    MoveContext for dropping tet on any board, for looking further ahead than
+    the current move without making a TetrisGameState for every position
+    '''
+    try:
+        board, yi, cleared = board.test_place_tetromino(tet, orient, col)
+    except GameOver:
+        return MoveContext(True)
+    return MoveContext(False, board, yi, cleared)
\ No newline at end of file
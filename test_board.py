@@ -0,0 +1,55 @@
+'''
+TetrisBoard.apply/undo against copying the board with test_place_tetromino,
+over mostly well played random games (so that lines get cleared)
+'''
+import random
+
+from board import GameOver, WIDTH, HEIGHT
+from state import TetrisGameState
+from dellacherie import DellacherieAgent
+
+def snapshot(board):
+    return (board.row_masks(), board.column_heights(), board.zobrist_hash(),
+        [board.letter(x, y) for x in range(WIDTH) for y in range(HEIGHT)])
+
+def test_apply_undo_matches_copy():
+    agent = DellacherieAgent(None)
+    rng = random.Random(0)
+    placements = clears = 0
+    for seed in range(4):
+        state = TetrisGameState(seed=seed)
+        for _ in range(100):
+            # the game's own colored board and an uncolored copy
+            for board in (state.board, state.board.copy(colors=False)):
+                before = snapshot(board)
+                for orient, col in state.get_moves():
+                    try:
+                        expected, yi, cleared = board.test_place_tetromino(state.tet, orient, col)
+                    except GameOver:
+                        try:
+                            board.apply(state.tet, orient, col)
+                        except GameOver:
+                            assert snapshot(board) == before
+                            continue
+                        raise AssertionError('apply placed a piece that ends the game')
+                    record = board.apply(state.tet, orient, col)
+                    assert record[:2] == (yi, cleared)
+                    assert board.row_masks() == expected.row_masks()
+                    assert board.column_heights() == expected.column_heights()
+                    assert board.zobrist_hash() == expected.zobrist_hash()
+                    # records nest, as they do in a search
+                    try:
+                        board.undo(board.apply(state.next_tet, 0, 0))
+                    except GameOver:
+                        pass
+                    board.undo(record)
+                    assert snapshot(board) == before
+                    placements += 1
+                    clears += bool(cleared)
+            moves = list(state.get_moves())
+            move = agent.get_best_move(state) if rng.random() < 0.8 else rng.choice(moves)
+            try:
+                state.make_move(*move)
+            except GameOver:
+                break
+    assert placements > 1000 and clears > 0
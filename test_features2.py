@@ -0,0 +1,34 @@
+'''
+the fused Dellacherie kernel against the per-feature functions it replaces
+'''
+import random
+
+from board import GameOver
+from state import TetrisGameState
+from dellacherie import DellacherieAgent
+import features2
+
+def test_fused_kernel_matches_features():
+    agent = DellacherieAgent(None)
+    features = list(agent.weights)
+    rng = random.Random(0)
+    moves_checked = 0
+    for seed in range(4):
+        state = TetrisGameState(seed=seed)
+        for _ in range(100):
+            for orient, col in state.get_moves():
+                expected = tuple(f(state, orient, col) for f in features2.DELLACHERIE_FEATURES)
+                fused = features2.dellacherie_features(state, orient, col)
+                # same values and same types, so weighted sums come out the same too
+                assert fused == expected
+                assert [type(v) for v in fused] == [type(v) for v in expected]
+                assert features2.feature_vector(state, orient, col, features) == \
+                    [f(state, orient, col) for f in features]
+                moves_checked += 1
+            moves = list(state.get_moves())
+            move = agent.get_best_move(state) if rng.random() < 0.85 else rng.choice(moves)
+            try:
+                state.make_move(*move)
+            except GameOver:
+                break
+    assert moves_checked > 1000
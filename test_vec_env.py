@@ -0,0 +1,50 @@
+'''
+VecTetrisEnv.step against TetrisGameState.make_move on the same positions
+'''
+import random
+
+import numpy as np
+
+from board import GameOver
+from dellacherie import DellacherieAgent
+from tetrominoes import tetlist
+from vec_env import VecTetrisEnv
+
+def test_step_matches_make_move():
+    agent = DellacherieAgent(None)
+    rng = random.Random(0)
+    env = VecTetrisEnv(8, seed=0)
+    cleared_total = ended = 0
+    for _ in range(150):
+        states = [env.game_state(g) for g in range(env.n_games)]
+        # even games are played well enough to clear lines, odd ones randomly so they end
+        actions = []
+        for g, state in enumerate(states):
+            moves = list(state.get_moves())
+            actions.append(agent.get_best_move(state) if g % 2 == 0 and rng.random() < 0.9 else rng.choice(moves))
+
+        expected = []
+        for state, move in zip(states, actions):
+            next_tet = state.next_tet
+            try:
+                _, reward, cleared = state.make_move(*move)
+            except GameOver:
+                expected.append(None)
+                continue
+            expected.append((reward, len(cleared), state.board.row_masks(), state.board.column_heights(), next_tet))
+
+        rewards, cleared, done = env.step(np.array([o for o, _ in actions]), np.array([c for _, c in actions]))
+        for g, e in enumerate(expected):
+            assert done[g] == (e is None)
+            if e is None:
+                # ended games start over
+                assert not env.rows[g].any()
+                continue
+            reward, n_cleared, rows, heights, next_tet = e
+            assert (rewards[g], cleared[g]) == (reward, n_cleared)
+            assert tuple(int(row) for row in env.rows[g]) == rows
+            assert tuple(int(h) for h in env.heights[g]) == heights
+            assert tetlist[env.tet[g]] is next_tet
+        cleared_total += int(cleared.sum())
+        ended += int(done.sum())
+    assert cleared_total > 0 and ended > 0
@@ -7,17 +7,34 @@ def lastindex(l, item):
     except ValueError:
         return -1
 class OrientedTetromino:
+    '''
+    one rotation of a tetromino. all of the geometry is worked out once from the
+    shape string when the module is imported and kept in tuples:
+
+    cells       (x, y) of each filled block, (0, 0) being the bottom left
+    row_masks   bitmask of the filled blocks in each row, bit x for column x
+    skirt       lowest filled y in each column
+    top         highest filled y in each column
+    '''
+    __slots__ = ('_blocks', 'shapestr', 'orientation', 'letter', 'height', 'width',
+        'cells', 'row_masks', 'skirt', 'top')
+
     def __init__(self, shape, orientation, letter):
-        self._blocks = []
         self.shapestr = shape
         self.orientation = orientation
         self.letter = letter
 
-        for line in reversed(shape.strip().split()):
-            self._blocks.append([1 if c == '#' else 0 for c in line])
+        self._blocks = tuple(tuple(1 if c == '#' else 0 for c in line)
+            for line in reversed(shape.strip().split()))
 
         self.height = sum([int(any(l)) for l in self._blocks])
         self.width = max([lastindex(l, 1) for l in self._blocks]) + 1
+        self.cells = tuple((x, y) for y in range(self.height) for x in range(self.width)
+            if self._blocks[y][x])
+        self.row_masks = tuple(sum(1 << x for x, b in enumerate(l) if b)
+            for l in self._blocks[:self.height])
+        self.skirt = tuple(min(y for x2, y in self.cells if x2 == x) for x in range(self.width))
+        self.top = tuple(max(y for x2, y in self.cells if x2 == x) for x in range(self.width))
 
     def __getitem__(self, slc):
         try:
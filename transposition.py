@@ -0,0 +1,54 @@
+from collections import OrderedDict
+
+class TranspositionTable:
+    '''
+    bounded LRU cache for evaluations of positions that come up more than once.
+    keys are usually (board.zobrist_hash(), tetromino letter, <what was evaluated>)
+    so that agents with different weights can share a table without mixing
+    up their entries. hits and misses are counted to help pick a size
+    '''
+
+    def __init__(self, size=4096):
+        self.size = size
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return f'TranspositionTable({len(self)}/{self.size})'
+
+    def get(self, key):
+        '''
+        cached value for key, or None if there isn't one
+        '''
+        try:
+            value = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0
+
+    def monitor(self):
+        out = f'transposition table entries = {len(self)}/{self.size}\n'
+        out += f'hits = {self.hits}, misses = {self.misses} (hit rate {self.hit_rate():.1%})'
+        return out
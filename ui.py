@@ -192,6 +192,7 @@ def curses_init():
     color_attrs['j'] = curses.color_pair(4)
     color_attrs['t'] = curses.color_pair(5)
     color_attrs['i'] = curses.color_pair(6)
+    color_attrs['#'] = curses.color_pair(7)
 
 
 def default_curses_window_init(stdscr):
@@ -0,0 +1,194 @@
+'''
+many games of tetris stepped in lockstep with numpy, for generating experience
+faster than one TetrisGameState at a time. every game is a row of a packed array
+of row bitmasks (the same layout TetrisBoard uses) with its own 7-bag of pieces
+'''
+import numpy as np
+
+from board import WIDTH, HEIGHT, SCORE_MAP, FULL_ROW, IllegalMove, TetrisBoard
+from state import TetrisGameState
+from tetrominoes import tetlist
+
+N_TETS = len(tetlist)
+MAX_ORIENTS = max(t.n_orientations() for t in tetlist)
+# pieces are at most 4 blocks wide and tall
+SPAN = 4
+
+def _piece_tables():
+    '''
+    geometry of every (tetromino, orientation) as arrays indexed [tet, orient, ...].
+    orientations wrap around the same way Tetromino.__getitem__ does
+    '''
+    row_masks = np.zeros((N_TETS, MAX_ORIENTS, SPAN), dtype=np.int64)
+    # columns past the piece's width get a skirt so large they never decide the landing row
+    skirts = np.full((N_TETS, MAX_ORIENTS, SPAN), 2*HEIGHT, dtype=np.int64)
+    tops = np.full((N_TETS, MAX_ORIENTS, SPAN), -1, dtype=np.int64)
+    widths = np.zeros((N_TETS, MAX_ORIENTS), dtype=np.int64)
+    heights = np.zeros((N_TETS, MAX_ORIENTS), dtype=np.int64)
+    for i, t in enumerate(tetlist):
+        for orient in range(MAX_ORIENTS):
+            ot = t[orient]
+            row_masks[i, orient, :ot.height] = ot.row_masks
+            skirts[i, orient, :ot.width] = ot.skirt
+            tops[i, orient, :ot.width] = ot.top
+            widths[i, orient] = ot.width
+            heights[i, orient] = ot.height
+    return row_masks, skirts, tops, widths, heights
+
+ROW_MASKS, SKIRTS, TOPS, WIDTHS, HEIGHTS = _piece_tables()
+N_ORIENTS = np.array([t.n_orientations() for t in tetlist])
+_SCORES = np.array(SCORE_MAP)
+_OFFSETS = np.arange(SPAN)
+_COLUMN_BITS = 1 << np.arange(WIDTH)
+
+class VecTetrisEnv:
+    '''
+    n_games games of tetris. step() takes one (orient, col) per game and makes
+    the same transition TetrisGameState.make_move would. games that end are
+    started over straight away; their final score and lines are kept in
+    final_score and final_lines until the next time they end
+    '''
+
+    def __init__(self, n_games, seed=None):
+        self.n_games = n_games
+        self.rng = np.random.default_rng(seed)
+
+        self.rows = np.zeros((n_games, HEIGHT), dtype=np.min_scalar_type(FULL_ROW))
+        self.heights = np.zeros((n_games, WIDTH), dtype=np.int64)
+        # bags[g, :bag_left[g]] are the pieces left in game g's bag, next one last
+        self.bags = np.zeros((n_games, N_TETS), dtype=np.int64)
+        self.bag_left = np.zeros(n_games, dtype=np.int64)
+        self.tet = np.zeros(n_games, dtype=np.int64)
+        self.next_tet = np.zeros(n_games, dtype=np.int64)
+
+        self.score = np.zeros(n_games, dtype=np.int64)
+        self.lines = np.zeros(n_games, dtype=np.int64)
+        self.pieces = np.zeros(n_games, dtype=np.int64)
+        self.final_score = np.zeros(n_games, dtype=np.int64)
+        self.final_lines = np.zeros(n_games, dtype=np.int64)
+        self.games_finished = 0
+
+        self.reset(np.ones(n_games, dtype=bool))
+
+    def _refill_bags(self, games):
+        self.bags[games] = np.argsort(self.rng.random((len(games), N_TETS)), axis=1)
+        self.bag_left[games] = N_TETS
+
+    def _pop_bags(self, games):
+        '''
+        next piece out of the bag of each of games (an index array)
+        '''
+        empty = games[self.bag_left[games] == 0]
+        if empty.size:
+            self._refill_bags(empty)
+        self.bag_left[games] -= 1
+        return self.bags[games, self.bag_left[games]]
+
+    def reset(self, mask):
+        '''
+        start new games wherever mask is true
+        '''
+        games = np.flatnonzero(mask)
+        if games.size == 0:
+            return
+        self.rows[games] = 0
+        self.heights[games] = 0
+        self.score[games] = 0
+        self.lines[games] = 0
+        self.pieces[games] = 0
+        self._refill_bags(games)
+        self.next_tet[games] = self._pop_bags(games)
+        self.tet[games] = self._pop_bags(games)
+
+    def n_orientations(self):
+        '''
+        number of distinct orientations of each game's current tetromino
+        '''
+        return N_ORIENTS[self.tet]
+
+    def legal(self, orients, cols):
+        '''
+        which (orient, col) pairs would fit inside the walls
+        '''
+        orients = np.asarray(orients) % self.n_orientations()
+        cols = np.asarray(cols)
+        return (cols >= 0) & (cols + WIDTHS[self.tet, orients] <= WIDTH)
+
+    def step(self, orients, cols):
+        '''
+        drop every game's current tetromino at (orients[g], cols[g]).
+        returns (rewards, lines cleared, done) arrays, with rewards following
+        TetrisBoard.score and games that ended already reset.
+        raises IllegalMove if any piece would stick out past the walls
+        '''
+        orients = np.asarray(orients) % self.n_orientations()
+        cols = np.asarray(cols)
+        if not self.legal(orients, cols).all():
+            raise IllegalMove
+
+        games = np.arange(self.n_games)
+        tet = self.tet
+        columns = np.minimum(cols[:, None] + _OFFSETS, WIDTH - 1)
+        landing = (self.heights[games[:, None], columns] - SKIRTS[tet, orients]).max(axis=1)
+        landing = np.maximum(landing, 0)
+        done = landing + HEIGHTS[tet, orients] > HEIGHT
+        alive = np.flatnonzero(~done)
+
+        a_land = landing[alive]
+        a_cols = cols[alive]
+        masks = ROW_MASKS[tet[alive], orients[alive]]
+        tops = TOPS[tet[alive], orients[alive]]
+        for dy in range(SPAN):
+            placed = masks[:, dy] != 0
+            g = alive[placed]
+            self.rows[g, a_land[placed] + dy] |= (masks[placed, dy] << a_cols[placed]).astype(self.rows.dtype)
+        for dx in range(SPAN):
+            placed = tops[:, dx] >= 0
+            g = alive[placed]
+            self.heights[g, a_cols[placed] + dx] = a_land[placed] + tops[placed, dx] + 1
+
+        full = self.rows == FULL_ROW
+        cleared = full.sum(axis=1)
+        clearing = np.flatnonzero(cleared)
+        if clearing.size:
+            self._remove_cleared_lines(clearing, full[clearing], cleared[clearing])
+
+        rewards = _SCORES[cleared]
+        self.score += rewards
+        self.lines += cleared
+        self.pieces[alive] += 1
+
+        self.tet[alive] = self.next_tet[alive]
+        self.next_tet[alive] = self._pop_bags(alive)
+
+        if done.any():
+            self.final_score[done] = self.score[done]
+            self.final_lines[done] = self.lines[done]
+            self.games_finished += int(done.sum())
+            self.reset(done)
+        return rewards, cleared, done
+
+    def _remove_cleared_lines(self, games, full, n_cleared):
+        # a stable sort on "is full" moves the full rows to the top, keeping the order of the rest
+        order = np.argsort(full, axis=1, kind='stable')
+        rows = np.take_along_axis(self.rows[games], order, axis=1)
+        rows[np.arange(HEIGHT) >= HEIGHT - n_cleared[:, None]] = 0
+        self.rows[games] = rows
+
+        blocks = (rows[:, :, None] & _COLUMN_BITS) != 0
+        # first filled row from the top of each column
+        from_top = np.argmax(blocks[:, ::-1, :], axis=1)
+        self.heights[games] = np.where(blocks.any(axis=1), HEIGHT - from_top, 0)
+
+    def game_state(self, g) -> TetrisGameState:
+        '''
+        TetrisGameState for game g, so agents written against TetrisGameState
+        can choose its moves. changes to it don't affect the env
+        '''
+        state = TetrisGameState()
+        state.board = TetrisBoard.from_row_masks(self.rows[g])
+        state.tet = tetlist[self.tet[g]]
+        state.next_tet = tetlist[self.next_tet[g]]
+        state.tet_iq = [int(t) for t in self.bags[g, :self.bag_left[g]]]
+        state.score = int(self.score[g])
+        return state